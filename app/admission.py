@@ -0,0 +1,96 @@
+# app/admission.py
+
+import asyncio
+import os
+import time
+from collections import deque
+from app import metrics
+
+# Calls running at once, and waiting for a slot, before new ones are turned away
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 32))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 128))
+# Time budget of a webhook call, under Dialogflow's 5 second deadline to leave room for the network
+WEBHOOK_BUDGET = float(os.getenv('WEBHOOK_BUDGET_MS', 4500)) / 1000
+
+# Weight of the latest call in the moving average of the service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+in_flight_count = 0
+# Futures of the calls waiting for a slot, first come first served
+waiters = deque()
+# Moving average of the seconds an admitted call takes
+service_time = 0.05
+
+class Overloaded(Exception):
+    """
+    Raised when a call is turned away because it couldn't be answered within its budget.
+    """
+
+def _shed(reason: str):
+    metrics.shed_requests.inc(reason)
+    raise Overloaded(reason)
+
+def expected_wait(position: int) -> float:
+    """
+    Return the seconds the waiter at a queue position is expected to wait for a slot.
+    """
+    return (position + 1) / ADMISSION_MAX_IN_FLIGHT * service_time
+
+async def admit(deadline: float):
+    """
+    Take a slot, waiting in line if they are all taken, by the deadline (time.monotonic()) of the call.
+    Raises Overloaded at once if the queue is full or the wait plus the service time would
+    miss the deadline, or after waiting if no slot freed up in time.
+    """
+    global in_flight_count
+    if in_flight_count < ADMISSION_MAX_IN_FLIGHT and not waiters:
+        # A free slot is always taken, which also keeps the service time up to date after a slow spell
+        in_flight_count += 1
+        return
+
+    if len(waiters) >= ADMISSION_MAX_QUEUE:
+        _shed("queue_full")
+    now = time.monotonic()
+    latest_start = deadline - service_time
+    if now + expected_wait(len(waiters)) > latest_start:
+        _shed("deadline")
+
+    future = asyncio.get_running_loop().create_future()
+    waiters.append(future)
+    try:
+        await asyncio.wait_for(asyncio.shield(future), latest_start - now)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if future.done():
+            # The slot was handed over just as the wait ended, pass it on
+            release()
+        else:
+            future.cancel()
+            waiters.remove(future)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        _shed("timeout")
+
+def release(elapsed: float = None):
+    """
+    Give up a slot, handing it to the first waiter still waiting, and record how long the call took.
+    """
+    global in_flight_count, service_time
+    if elapsed is not None:
+        service_time += SERVICE_TIME_SMOOTHING * (elapsed - service_time)
+    while waiters:
+        future = waiters.popleft()
+        if not future.done():
+            future.set_result(None)  # The slot goes straight to the waiter
+            return
+    in_flight_count -= 1
+
+async def run_admitted(deadline: float, handler, *args):
+    """
+    Run a handler once admitted, and return its reply. Raises Overloaded if it isn't admitted.
+    """
+    await admit(deadline)
+    start = time.perf_counter()
+    try:
+        return await handler(*args)
+    finally:
+        release(time.perf_counter() - start)
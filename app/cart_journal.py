@@ -0,0 +1,306 @@
+# app/cart_journal.py
+
+import asyncio
+import logging
+import os
+import re
+import struct
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from app import sessions
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of the buffered journal lines, and between snapshots
+CART_JOURNAL_FLUSH_INTERVAL = float(os.getenv('CART_JOURNAL_FLUSH_MS', 100)) / 1000
+CART_SNAPSHOT_INTERVAL = float(os.getenv('CART_SNAPSHOT_INTERVAL', 60))
+
+# Snapshot layout: magic, (name count, session count), the interned item names in code order,
+# then per session (session id length, record length), session id, packed record (see app.sessions)
+SNAPSHOT_MAGIC = b"CARTSNAP1\n"
+SNAPSHOT_COUNTS = struct.Struct("<II")
+SNAPSHOT_NAME = struct.Struct("<H")
+SNAPSHOT_SESSION = struct.Struct("<HH")
+
+# journal.<generation>.log holds the changes made after snapshot.<generation>.bin was taken
+FILE_NAME = re.compile(r"(journal|snapshot)\.(\d+)\.(?:log|bin)$")
+# Locked by the process using the directory
+LOCK_FILE = "lock"
+
+class CartJournal:
+    """
+    Keeps the carts of a MemorySessionStore across restarts. Every cart change is appended to a
+    journal, and a compact snapshot of all the carts is taken periodically, after which the older
+    files are dropped. On startup the latest snapshot is loaded and the journal tail replayed.
+    Files are only touched by a dedicated thread; a turn only buffers one journal line.
+    The directory is locked by the process using it, other processes run without a journal.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.generation = 1
+        self.pending = []  # Journal lines not written yet
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cart-journal")
+        self._file = None
+        self._file_generation = None
+        self._task = None
+        self._lock_file = None
+
+    def _path(self, kind: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{kind}.{generation}.{'log' if kind == 'journal' else 'bin'}")
+
+    def record_cart(self, session_id: str, last_activity: float, cart: dict):
+        """
+        Journal the new cart of a session.
+        """
+        self.pending.append(orjson.dumps([session_id, last_activity, cart], option=orjson.OPT_APPEND_NEWLINE))
+
+    def record_delete(self, session_id: str):
+        """
+        Journal the end of a session.
+        """
+        self.pending.append(orjson.dumps([session_id], option=orjson.OPT_APPEND_NEWLINE))
+
+    # Writer thread
+
+    def _write(self, generation: int, data: bytes):
+        if self._file_generation != generation:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self._path("journal", generation), "ab", buffering=0)
+            self._file_generation = generation
+        self._file.write(data)
+
+    def _write_snapshot(self, generation: int, names: list, records: list):
+        path = self._path("snapshot", generation)
+        with open(path + ".tmp", "wb") as file:
+            file.write(SNAPSHOT_MAGIC)
+            file.write(SNAPSHOT_COUNTS.pack(len(names), len(records)))
+            for name in names:
+                encoded = name.encode("utf-8")
+                file.write(SNAPSHOT_NAME.pack(len(encoded)))
+                file.write(encoded)
+            for session_id, record in records:
+                encoded = session_id.encode("utf-8")
+                file.write(SNAPSHOT_SESSION.pack(len(encoded), len(record)))
+                file.write(encoded)
+                file.write(record)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+        # The snapshot covers everything before it, drop the older files
+        for file_name in os.listdir(self.directory):
+            match = FILE_NAME.match(file_name)
+            if match and int(match.group(2)) < generation:
+                os.remove(os.path.join(self.directory, file_name))
+
+    def _read_snapshot(self, path: str) -> tuple:
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("not a cart snapshot")
+        offset = len(SNAPSHOT_MAGIC)
+        name_count, session_count = SNAPSHOT_COUNTS.unpack_from(data, offset)
+        offset += SNAPSHOT_COUNTS.size
+        names = []
+        for _ in range(name_count):
+            (length,) = SNAPSHOT_NAME.unpack_from(data, offset)
+            offset += SNAPSHOT_NAME.size
+            names.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        records = OrderedDict()
+        for _ in range(session_count):
+            id_length, record_length = SNAPSHOT_SESSION.unpack_from(data, offset)
+            offset += SNAPSHOT_SESSION.size
+            session_id = data[offset:offset + id_length].decode("utf-8")
+            offset += id_length
+            records[session_id] = data[offset:offset + record_length]
+            offset += record_length
+        if offset != len(data):
+            raise ValueError("trailing bytes")
+        return names, records
+
+    def _replay(self, path: str, names: list, records: OrderedDict):
+        codes = {name: code for code, name in enumerate(names)}
+        with open(path, "rb") as file:
+            for line in file:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    logger.warning("Stopped replaying %s at a truncated line.", path)
+                    break
+                if len(entry) == 1:
+                    records.pop(entry[0], None)
+                else:
+                    session_id, last_activity, cart = entry
+                    records[session_id] = sessions.pack_record(last_activity, cart, codes, names)
+                    records.move_to_end(session_id)
+
+    def _load(self) -> tuple:
+        """
+        Load the latest readable snapshot and replay the journals written after it,
+        and return a tuple: (Interned item names, OrderedDict session_id -> Packed record, Latest generation on disk).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        generations = {"journal": [], "snapshot": []}
+        for file_name in os.listdir(self.directory):
+            match = FILE_NAME.match(file_name)
+            if match:
+                generations[match.group(1)].append(int(match.group(2)))
+            elif file_name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, file_name))  # Snapshot interrupted while written
+
+        names, records, base_generation = [], OrderedDict(), 0
+        for generation in sorted(generations["snapshot"], reverse=True):
+            path = self._path("snapshot", generation)
+            try:
+                names, records = self._read_snapshot(path)
+                base_generation = generation
+                break
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("Skipping the unreadable cart snapshot %s: %s", path, e)
+
+        for generation in sorted(generations["journal"]):
+            if generation >= base_generation:
+                self._replay(self._path("journal", generation), names, records)
+        return names, records, max(generations["journal"] + generations["snapshot"], default=0)
+
+    def _lock(self):
+        """
+        Take the exclusive lock of the directory, creating it if needed.
+        Raises OSError if it can't be created or another process holds the lock.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            raise
+        self._lock_file = lock_file
+
+    def _unlock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()  # Releases the lock
+            self._lock_file = None
+
+    # Event loop
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def restore(self, store) -> bool:
+        """
+        Lock the directory and restore the carts of an empty store from the files, reading them off the event loop,
+        and return a bool: False if the directory is unavailable or used by another process, the journal can't be used then.
+        """
+        start = time.perf_counter()
+        try:
+            await self._run(self._lock)
+            names, records, latest_generation = await self._run(self._load)
+        except OSError as e:
+            logger.warning("Cart journal turned off, %s can't be used: %s", self.directory, e)
+            await self._run(self._unlock)
+            self._executor.shutdown(wait=False)
+            return False
+        self.generation = latest_generation + 1
+        if store.sessions or sessions.item_names:
+            logger.warning("Not restoring the carts into a store already in use.")
+            return True
+        sessions.item_names.extend(names)
+        sessions.item_codes.update((name, code) for code, name in enumerate(names))
+        store.sessions = records
+        logger.info("Restored %s carts in %.3fs.", len(records), time.perf_counter() - start)
+        return True
+
+    def _submit_pending(self):
+        """
+        Hand the buffered lines to the writer thread, and return the future of the write.
+        """
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return asyncio.get_running_loop().run_in_executor(self._executor, self._write, self.generation, data)
+
+    async def flush(self):
+        """
+        Write the buffered journal lines.
+        """
+        if self.pending:
+            await self._submit_pending()
+
+    async def snapshot(self, store):
+        """
+        Take a snapshot of the store and start a new journal generation after it.
+        """
+        written = self._submit_pending() if self.pending else None
+        self.generation += 1
+        # Records are immutable bytes, copying the references is a consistent snapshot
+        names, records = list(sessions.item_names), list(store.sessions.items())
+        if written is not None:
+            await written
+        await self._run(self._write_snapshot, self.generation, names, records)
+
+    async def _maintain(self, store):
+        """
+        Write the journal lines and take the snapshots periodically.
+        """
+        loop = asyncio.get_running_loop()
+        next_snapshot = loop.time()  # Compact what was restored first
+        while True:
+            try:
+                if loop.time() >= next_snapshot:
+                    await self.snapshot(store)
+                    next_snapshot = loop.time() + CART_SNAPSHOT_INTERVAL
+                else:
+                    await self.flush()
+            except Exception as e:
+                # Keep journaling, a failed write or snapshot is retried on the next round
+                logger.error("Error writing the cart journal: %s", e)
+            await asyncio.sleep(CART_JOURNAL_FLUSH_INTERVAL)
+
+    def start(self, store):
+        """
+        Start writing the journal and the snapshots of the store in the background.
+        """
+        self._task = asyncio.create_task(self._maintain(store))
+
+    async def close(self, store):
+        """
+        Stop the background writes and take a last snapshot, so the next start has no journal to replay.
+        """
+        if self._task is None:
+            # Never started: the files weren't restored, don't replace them with this store's carts
+            self._unlock()
+            self._executor.shutdown(wait=False)
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("The cart journal writer had stopped: %s", e)
+        self._task = None
+        try:
+            await self.snapshot(store)
+        except Exception as e:
+            logger.error("Error writing the cart snapshot: %s", e)
+        await self._run(self._close_file)
+        await self._run(self._unlock)
+        self._executor.shutdown(wait=True)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
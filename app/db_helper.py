@@ -1,15 +1,39 @@
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from decimal import Decimal
+from functools import wraps
 from dotenv import load_dotenv
 import aiomysql
 import asyncio
+import orjson
+from app import metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
-async def get_db_connection():
+logger = logging.getLogger(__name__)
+
+# Shared connection pool, created by the FastAPI lifespan (see app.main)
+db_pool = None
+# Seconds a connection can sit idle in the pool before it is pinged on acquire
+DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', 60))
+
+# Errors after which the place_orders transaction is known to be rolled back, so saving again can't duplicate orders
+ROLLED_BACK_ERRORS = (1205, 1213)  # Lock wait timeout, deadlock
+ORDER_SAVE_ATTEMPTS = 3
+
+async def init_db_pool():
     """
-    Establish a connection to the database and return an aiomysql connection object.
+    Create the shared aiomysql connection pool and return it.
+    Pool sizing and recycling are configured through environment variables.
     """
+    global db_pool
+    if db_pool is not None:
+        return db_pool
+
     db_config = {
         'user': os.getenv('DB_USER'),
         'password': os.getenv('DB_PASSWORD'),
@@ -17,30 +41,93 @@ async def get_db_connection():
         'db': os.getenv('DB_NAME')
     }
     try:
-        connection = await aiomysql.connect(**db_config)
-        return connection
+        db_pool = await aiomysql.create_pool(
+            minsize=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            maxsize=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 3600)),  # Seconds before an idle connection is replaced
+            **db_config
+        )
+        return db_pool
     except aiomysql.Error as error:
-        print("Error connecting to MySQL database:", error)
+        logger.error("Error creating MySQL connection pool: %s", error)
+        metrics.db_query_errors.inc("connect")
         return None
 
+async def close_db_pool():
+    """
+    Close the shared connection pool and wait for its connections to be released.
+    """
+    global db_pool
+    if db_pool is None:
+        return
+    db_pool.close()
+    await db_pool.wait_closed()
+    db_pool = None
+
+@asynccontextmanager
+async def get_db_connection():
+    """
+    Acquire a connection from the shared pool and release it on exit.
+    Connections idle for longer than DB_POOL_PING_INTERVAL are pinged before use,
+    and a connection that raised a database error is closed so the pool replaces it.
+    Yields None if no connection can be obtained.
+    """
+    pool = db_pool or await init_db_pool()
+    if pool is None:
+        yield None
+        return
+
+    acquire_start = time.perf_counter()
+    try:
+        connection = await pool.acquire()
+    except aiomysql.Error as error:
+        logger.error("Error connecting to MySQL database: %s", error)
+        metrics.db_query_errors.inc("connect")
+        yield None
+        return
+    metrics.db_acquire_latency.observe(time.perf_counter() - acquire_start)
+
+    try:
+        # Health check for connections that sat idle in the pool
+        if asyncio.get_running_loop().time() - connection.last_usage > DB_POOL_PING_INTERVAL:
+            await connection.ping(reconnect=True)
+        yield connection
+    except aiomysql.Error:
+        connection.close()  # Recycle the broken connection
+        raise
+    finally:
+        await pool.release(connection)
+
+def timed_operation(func):
+    """
+    Record the duration of a database operation under the name of the decorated function.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.db_query_latency.observe(time.perf_counter() - start, func.__name__)
+    return wrapper
+
 async def execute_query(query, params=None):
     """
     Execute a query and return the result.
     """
-    connection = await get_db_connection()
-    if connection is None:
-        return None
     try:
-        async with connection.cursor() as cursor:
-            await cursor.execute(query, params)
-            result = await cursor.fetchall()
-            await connection.commit()
-        return result
+        async with get_db_connection() as connection:
+            if connection is None:
+                return None
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                result = await cursor.fetchall()
+                await connection.commit()
+            return result
     except aiomysql.Error as error:
-        print("Error executing query:", error)
+        logger.error("Error executing query: %s", error)
+        metrics.db_query_errors.inc("execute_query")
         return None
-    finally:
-        connection.close()
 
 async def execute_non_query(query, params=None):
     """
@@ -50,68 +137,66 @@ async def execute_non_query(query, params=None):
     result = await execute_query(query, params)
     return result is not None
 
-async def does_food_item_exist(food_item: str) -> bool:
+@timed_operation
+async def get_food_items():
     """
-    Check if the given food item exists in the food_items table,
-    and return a bool: True if the food item exists, False otherwise.
+    Get every food item,
+    and return a list of tuples: (item_id, name, price), or None if the query failed.
     """
-    query = "SELECT name FROM food_items WHERE name = %s"
-    result = await execute_query(query, (food_item,))
-    return bool(result)
+    query = "SELECT item_id, name, price FROM food_items"
+    return await execute_query(query)
+
+def sales_hour(moment: datetime) -> datetime:
+    """
+    Return the start of the hour a checkout time falls in, the key of the hourly sales rollup.
+    """
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+@timed_operation
+async def save_orders_to_db(orders: list):
+    """
+    Save a batch of orders in one round trip, through the place_orders procedure
+    (see setup/uma_food_chatbot.sql) which prices the items from the food_items table,
+    and return a list of tuples: (The new order ID, Total order price) in the same order, or None if the transaction failed.
+    An order with an item that isn't on the menu gets (0, 0) and isn't saved, the others are.
+    A deadlock or lock wait timeout, which rolls the whole batch back, is retried.
+    """
+    if not orders:
+        return []
+
+    carts = orjson.dumps([[{"name": item_name, "quantity": quantity} for item_name, quantity in order.items()] for order in orders])
+    created_at = datetime.now().replace(microsecond=0)
+    for attempt in range(1, ORDER_SAVE_ATTEMPTS + 1):
+        try:
+            async with get_db_connection() as connection:
+                if connection is None:
+                    return None
+
+                # The procedure commits or rolls back its own transaction
+                async with connection.cursor() as cursor:
+                    await cursor.execute("CALL place_orders(%s, %s)", (carts.decode(), created_at))
+                    (results,) = await cursor.fetchone()
+                # Totals come back as strings to keep them exact
+                return [(new_order_id, Decimal(total_order_price)) for new_order_id, total_order_price in orjson.loads(results)]
+        except aiomysql.Error as error:
+            # Other errors, such as a lost connection, may come after the COMMIT: retrying could save the orders twice
+            if error.args and error.args[0] in ROLLED_BACK_ERRORS and attempt < ORDER_SAVE_ATTEMPTS:
+                logger.warning("Saving orders was rolled back, retrying: %s", error)
+                continue
+            logger.error("Error saving orders to DB: %s", error)
+            metrics.db_query_errors.inc("save_orders_to_db")
+            return None
 
 async def save_order_to_db(order: dict) -> tuple:
     """
-    Save the order details to the database, 
+    Save the order details to the database in one round trip, pricing the items from the food_items table,
     and return a tuple: (The new order ID, Total order price) if the operation is successful, (0, 0) otherwise.
+    Nothing is saved if an item isn't on the menu.
     """
-    connection = await get_db_connection()
-    if connection is None:
-        return 0, 0
-
-    try:
-        async with connection.cursor() as cursor:
-            # Get the new order ID
-            query = "SELECT COALESCE(MAX(order_id), 0) + 1 FROM orders"
-            await cursor.execute(query)
-            result = await cursor.fetchone()
-            new_order_id = result[0]
-
-            # Collect all queries for batch insertion
-            order_queries = []
-            total_order_price = 0
-
-            for item_name, quantity in order.items():
-                query = "SELECT item_id, price FROM food_items WHERE name = %s"
-                await cursor.execute(query, (item_name,))
-                result = await cursor.fetchone()
-                if not result:
-                    return 0, 0
-
-                item_id, price = result
-                total_price = price * quantity
-                total_order_price += total_price
-
-                order_queries.append((new_order_id, item_id, quantity, total_price))
-
-            # Insert all orders in a batch
-            insert_query = """
-                INSERT INTO orders (order_id, item_id, quantity, total_price)
-                VALUES (%s, %s, %s, %s)
-            """
-            await cursor.executemany(insert_query, order_queries)
-
-            # Insert order tracking
-            tracking_query = "INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)"
-            await cursor.execute(tracking_query, (new_order_id, 'in progress'))
-
-        await connection.commit()
-        return new_order_id, total_order_price
-    except aiomysql.Error as error:
-        print("Error saving order to DB:", error)
-        return 0, 0
-    finally:
-        connection.close()
+    results = await save_orders_to_db([order])
+    return results[0] if results else (0, 0)
 
+@timed_operation
 async def get_order_status(order_id):
     """
     Get the status of an order, 
@@ -122,3 +207,161 @@ async def get_order_status(order_id):
     if result:
         return result[0][0]
     return None
+
+@timed_operation
+async def get_order_statuses(order_ids: list):
+    """
+    Get the status of many orders in a single query,
+    and return a dict: order_id -> Status for the orders found, or None if the query failed.
+    """
+    if not order_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    query = f"SELECT order_id, status FROM order_tracking WHERE order_id IN ({placeholders})"
+    result = await execute_query(query, tuple(order_ids))
+    if result is None:
+        return None
+    return dict(result)
+
+@timed_operation
+async def update_order_statuses(updates: list):
+    """
+    Apply a chunk of (order_id, status) updates in one transaction, the last one winning for an order,
+    and return a set of the order IDs that exist and were updated, or None if the transaction failed.
+    Orders that don't exist are left alone rather than created.
+    """
+    latest = dict(updates)
+    if not latest:
+        return set()
+
+    try:
+        async with get_db_connection() as connection:
+            if connection is None:
+                return None
+
+            async with connection.cursor() as cursor:
+                # Lock the rows in order_id order so concurrent chunks can't deadlock
+                order_ids = sorted(latest)
+                placeholders = ", ".join(["%s"] * len(order_ids))
+                await cursor.execute(f"SELECT order_id FROM order_tracking WHERE order_id IN ({placeholders}) ORDER BY order_id FOR UPDATE", order_ids)
+                found = {row[0] for row in await cursor.fetchall()}
+
+                if found:
+                    # One statement for the whole chunk rather than one UPDATE per row
+                    found_ids = sorted(found)
+                    cases = " ".join(["WHEN %s THEN %s"] * len(found_ids))
+                    placeholders = ", ".join(["%s"] * len(found_ids))
+                    update_query = f"UPDATE order_tracking SET status = CASE order_id {cases} END WHERE order_id IN ({placeholders})"
+                    params = [value for order_id in found_ids for value in (order_id, latest[order_id])]
+                    await cursor.execute(update_query, params + found_ids)
+
+            await connection.commit()
+            return found
+    except aiomysql.Error as error:
+        logger.error("Error updating order statuses: %s", error)
+        metrics.db_query_errors.inc("update_order_statuses")
+        return None
+
+@timed_operation
+async def get_top_selling_items(limit: int):
+    """
+    Get the best selling items from the sales rollup,
+    and return a list of tuples: (item_id, name, quantity, revenue, order_count), or None if the query failed.
+    """
+    query = """
+        SELECT s.item_id, f.name, s.quantity, s.revenue, s.order_count
+        FROM sales_by_item s LEFT JOIN food_items f ON f.item_id = s.item_id
+        ORDER BY s.quantity DESC, s.revenue DESC LIMIT %s
+    """
+    return await execute_query(query, (limit,))
+
+@timed_operation
+async def get_sales_by_hour(since: datetime):
+    """
+    Get the hourly sales rollup from an hour on,
+    and return a list of tuples: (sales_hour, order_count, item_count, revenue), or None if the query failed.
+    """
+    query = "SELECT sales_hour, order_count, item_count, revenue FROM sales_by_hour WHERE sales_hour >= %s ORDER BY sales_hour"
+    return await execute_query(query, (since,))
+
+async def _scan_sales(cursor, page_size: int) -> tuple:
+    """
+    Recompute the sales rollups from the orders, a page of order lines at a time,
+    and return a tuple: (Dict item_id -> (quantity, revenue, order_count), Dict sales_hour -> (order_count, item_count, revenue)).
+    """
+    item_totals, hour_totals = {}, {}
+    last_key = (0, 0)
+    last_order_id = None
+    scan_query = """
+        SELECT o.order_id, o.item_id, o.quantity, o.total_price, t.created_at
+        FROM orders o JOIN order_tracking t ON t.order_id = o.order_id
+        WHERE (o.order_id, o.item_id) > (%s, %s)
+        ORDER BY o.order_id, o.item_id LIMIT %s
+    """
+    while True:
+        await cursor.execute(scan_query, (*last_key, page_size))
+        rows = await cursor.fetchall()
+        for order_id, item_id, quantity, total_price, created_at in rows:
+            item = item_totals.setdefault(item_id, [0, 0, 0])
+            item[0] += quantity
+            item[1] += total_price
+            item[2] += 1
+            hour = hour_totals.setdefault(sales_hour(created_at), [0, 0, 0])
+            hour[0] += order_id != last_order_id
+            hour[1] += quantity
+            hour[2] += total_price
+            last_order_id = order_id
+        if len(rows) < page_size:
+            break
+        last_key = rows[-1][:2]
+    return ({key: tuple(value) for key, value in item_totals.items()},
+            {key: tuple(value) for key, value in hour_totals.items()})
+
+async def _read_sales_rollups(cursor) -> tuple:
+    """
+    Read the stored sales rollups, in the same shape as _scan_sales.
+    """
+    await cursor.execute("SELECT item_id, quantity, revenue, order_count FROM sales_by_item")
+    item_totals = {row[0]: tuple(row[1:]) for row in await cursor.fetchall()}
+    await cursor.execute("SELECT sales_hour, order_count, item_count, revenue FROM sales_by_hour")
+    hour_totals = {row[0]: tuple(row[1:]) for row in await cursor.fetchall()}
+    return item_totals, hour_totals
+
+@timed_operation
+async def check_sales_rollups(rebuild: bool = False, page_size: int = 10_000):
+    """
+    Recompute the sales rollups from the orders and read the stored ones in the same transaction,
+    replacing the stored ones with the recomputed ones if rebuild,
+    and return a tuple: (Recomputed rollups, Stored rollups before a rebuild), or None if the operation failed.
+    A rebuild locks the rollup tables first, so checkouts wait for it and none is counted twice or missed.
+    """
+    try:
+        async with get_db_connection() as connection:
+            if connection is None:
+                return None
+
+            async with connection.cursor() as cursor:
+                await connection.begin()
+                if rebuild:
+                    await cursor.execute("SELECT item_id FROM sales_by_item FOR UPDATE")
+                    await cursor.execute("SELECT sales_hour FROM sales_by_hour FOR UPDATE")
+                stored = await _read_sales_rollups(cursor)
+                recomputed = await _scan_sales(cursor, page_size)
+
+                if rebuild:
+                    await cursor.execute("DELETE FROM sales_by_item")
+                    await cursor.execute("DELETE FROM sales_by_hour")
+                    item_totals, hour_totals = recomputed
+                    await cursor.executemany(
+                        "INSERT INTO sales_by_item (item_id, quantity, revenue, order_count) VALUES (%s, %s, %s, %s)",
+                        [(item_id, *totals) for item_id, totals in sorted(item_totals.items())])
+                    await cursor.executemany(
+                        "INSERT INTO sales_by_hour (sales_hour, order_count, item_count, revenue) VALUES (%s, %s, %s, %s)",
+                        [(hour, *totals) for hour, totals in sorted(hour_totals.items())])
+
+            await connection.commit()
+            return recomputed, stored
+    except aiomysql.Error as error:
+        logger.error("Error checking the sales rollups: %s", error)
+        metrics.db_query_errors.inc("check_sales_rollups")
+        return None
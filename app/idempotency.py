@@ -0,0 +1,136 @@
+# app/idempotency.py
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from app import admission, metrics
+from app.responses import FulfillmentResponse
+
+logger = logging.getLogger(__name__)
+
+# Dialogflow retries within its 5 second deadline, keep the replies a bit longer than that
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10_000))
+# Longest wait for a duplicate running on another worker, and how often its reply is looked for
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT_MS', 4500)) / 1000
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+# (responseId, session id) -> (reply body, status code, expiry time), oldest first
+completed_replies = OrderedDict()
+# (responseId, session id) -> task computing the reply
+in_flight = {}
+
+def _expire(now: float):
+    """
+    Drop the replies whose TTL has passed, looking only at those.
+    """
+    while completed_replies:
+        key, (_, _, expires_at) = next(iter(completed_replies.items()))
+        if expires_at > now:
+            break
+        del completed_replies[key]
+
+def _store_reply(key, response: FulfillmentResponse):
+    completed_replies[key] = (response.body, response.status_code, time.monotonic() + IDEMPOTENCY_TTL)
+    while len(completed_replies) > IDEMPOTENCY_CACHE_SIZE:
+        completed_replies.popitem(last=False)
+
+async def _claim(store, shared_key: str):
+    """
+    Claim a call in the store shared by the workers, waiting while another worker runs it,
+    and return a FulfillmentResponse: the reply stored by the other worker, or None if this worker claimed the call.
+    Raises admission.Overloaded if the other worker doesn't answer within IDEMPOTENCY_WAIT.
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        try:
+            claimed, stored = await store.claim_reply(shared_key, IDEMPOTENCY_TTL)
+        except Exception as e:
+            # Answering matters more than deduplicating, run the call
+            logger.error("Error claiming a webhook call in the session store: %s", e)
+            return None
+        if claimed:
+            return None
+        if stored is not None:
+            body, status_code = stored
+            return FulfillmentResponse(body, status_code=status_code)
+        if time.monotonic() >= deadline:
+            metrics.shed_requests.inc("duplicate_running")
+            raise admission.Overloaded("duplicate_running")
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+async def _execute(key, handle, store):
+    """
+    Run the handler and store its reply for the duplicates of the call, claiming the call first
+    in a store shared by the workers so that a duplicate sent to another worker isn't run twice.
+    """
+    try:
+        shared_key = None
+        if store is not None and store.shared:
+            shared_key = "%s:%s" % key
+            response = await _claim(store, shared_key)
+            if response is not None:
+                _store_reply(key, response)
+                return response
+
+        try:
+            response = await handle()
+        except BaseException:
+            if shared_key is not None:
+                await _release(store, shared_key)
+            raise
+        if isinstance(response, FulfillmentResponse):
+            _store_reply(key, response)
+            if shared_key is not None:
+                try:
+                    await store.save_reply(shared_key, response.body, response.status_code, IDEMPOTENCY_TTL)
+                except Exception as e:
+                    logger.error("Error storing a webhook reply in the session store: %s", e)
+        elif shared_key is not None:
+            await _release(store, shared_key)
+        return response
+    finally:
+        del in_flight[key]
+
+async def _release(store, shared_key: str):
+    try:
+        await store.release_reply(shared_key)
+    except Exception as e:
+        logger.error("Error releasing a webhook call in the session store: %s", e)
+
+async def run_once(response_id: str, session_id: str, handle, store=None):
+    """
+    Run handle() once per Dialogflow responseId and session, and return its reply.
+    A duplicate gets the stored reply, or waits for the call still running.
+    With a session store shared by the workers (SQLite or Redis), this holds across workers too.
+    Calls without a responseId are always run.
+    """
+    if not response_id:
+        return await handle()
+
+    key = (response_id, session_id)
+    _expire(time.monotonic())
+    stored = completed_replies.get(key)
+    if stored is not None:
+        body, status_code, _ = stored
+        return FulfillmentResponse(body, status_code=status_code)
+
+    task = in_flight.get(key)
+    if task is None:
+        # The task keeps running if the caller gives up, so a retry can pick up its reply
+        task = in_flight[key] = asyncio.create_task(_execute(key, handle, store))
+        return await asyncio.shield(task)
+
+    response = await asyncio.shield(task)
+    if isinstance(response, FulfillmentResponse):
+        return FulfillmentResponse(response.body, status_code=response.status_code)
+    return response
+
+async def drain():
+    """
+    Wait for the calls still running, e.g. before shutting down.
+    """
+    if in_flight:
+        await asyncio.gather(*in_flight.values(), return_exceptions=True)
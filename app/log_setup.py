@@ -0,0 +1,88 @@
+# app/log_setup.py
+
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# Records waiting for the writer thread; new records are dropped when it is full
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10_000))
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking the caller.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped_records = 0
+
+    def prepare(self, record):
+        # Merge the arguments now since they may be mutated after the call,
+        # the formatting (timestamps, exception text) is left to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records below WARNING.
+    """
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+def _parse_settings(value: str) -> dict:
+    """
+    Parse a "logger=value,logger=value" setting.
+    """
+    settings = {}
+    for entry in value.split(","):
+        name, _, setting = entry.partition("=")
+        if name.strip() and setting.strip():
+            settings[name.strip()] = setting.strip()
+    return settings
+
+def dropped_records() -> int:
+    """
+    Return the number of records dropped because the writer thread fell behind.
+    """
+    return sum(handler.dropped_records for handler in logging.getLogger().handlers if isinstance(handler, NonBlockingQueueHandler))
+
+def setup_logging() -> QueueListener:
+    """
+    Route all logging through a queue to a background writer thread, and apply the
+    per-logger levels (LOG_LEVELS) and sampling rates (LOG_SAMPLING) from the environment.
+    Return the listener writing the records.
+    """
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers[:] = [NonBlockingQueueHandler(log_queue)]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    # e.g. LOG_LEVELS=app.main=DEBUG,app.db_helper=WARNING
+    for name, level in _parse_settings(os.getenv('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level.upper())
+    # e.g. LOG_SAMPLING=app.main=0.01
+    for name, rate in _parse_settings(os.getenv('LOG_SAMPLING', '')).items():
+        logging.getLogger(name).addFilter(SamplingFilter(float(rate)))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,90 +1,202 @@
 # app/main.py
 
 import asyncio
+import hmac
+import os
 import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from typing import List
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from app import db_helper, generic_helper
+from app import admission, db_helper, generic_helper, idempotency, log_setup, menu_catalog, metrics, order_status, order_writer, pages, responses, sales_reports, sessions, static_assets, status_ingest, traffic_capture, webhook_payload
+from app.responses import FulfillmentResponse
 import logging
 
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+log_setup.setup_logging()
+logger = logging.getLogger(__name__)
 
 # Debugging purpose
 def print_orders_sessions(func):
     """
-    Wrapper to print active sessions before calling the decorated function
+    Wrapper to print the session's order after calling the decorated function, when debug logging is on.
+    The cart is peeked at, so logging doesn't keep the session alive.
     """
-    async def wrapper(*args, **kwargs):
-        result = await func(*args, **kwargs)
-        logging.info(f"Orders Sessions: {active_orders_sessions}")
+    async def wrapper(session_id, *args, **kwargs):
+        result = await func(session_id, *args, **kwargs)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Order Session %s: %s", session_id, await session_store.peek_cart(session_id))
         return result
     return wrapper
 
-# Dictionary for active orders and last activity times
-active_orders_sessions = {}
-last_activity_times = {}
+# Store for the carts of active sessions, selected by SESSION_STORE
+session_store = sessions.create_session_store()
+SESSION_CLEANUP_INTERVAL = int(os.getenv('SESSION_CLEANUP_INTERVAL', 60))
+
+# Bearer token of the endpoints that change state outside of a conversation; they are closed while it isn't set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+def require_admin_token(request: Request):
+    """
+    Check the request carries the ADMIN_TOKEN as a bearer token, raising a 401 if it doesn't
+    and a 403 if no token is configured.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to use this endpoint")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing bearer token", headers={"WWW-Authenticate": "Bearer"})
 
 async def cleanup_inactive_sessions():
     """
-    Periodically removes inactive sessions from active sessions 
-    and last activity times dictionaries to manage resources.
+    Periodically removes inactive sessions from the session store to manage resources.
+    Each run only costs as much as the number of expired sessions.
     """
     while True:
-        await asyncio.sleep(60 * 15)  # Run every 15 minutes
-        current_time = time.time()
-        timeout = 60 * 30  # 30 minutes of inactivity
-        inactive_sessions = [session_id for session_id, last_activity in last_activity_times.items() if current_time - last_activity > timeout]
-        for session_id in inactive_sessions:
-            del active_orders_sessions[session_id]
-            del last_activity_times[session_id]
-            logging.info(f"Session {session_id} has been cleaned up due to inactivity.")
+        await asyncio.sleep(SESSION_CLEANUP_INTERVAL)
+        cleaned_up = await session_store.cleanup()
+        if cleaned_up:
+            logger.info("%s sessions have been cleaned up due to inactivity.", cleaned_up)
 
 # Lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Manages the lifespan of the FastAPI app, starting the cleanup task on startup
-    and properly handling its shutdown.
+    Manages the lifespan of the FastAPI app, warming up the database pool, the menu, the carts and the
+    rendered pages and starting the background tasks on startup, and properly handling their shutdown.
+    The server only takes traffic once the startup is done.
     """
     # Startup
-    cleanup_task = asyncio.create_task(cleanup_inactive_sessions())
+    await db_helper.init_db_pool()
+    await menu_catalog.load_menu()
+    await session_store.start()  # Restores the carts kept across restarts
+    static_assets.load_manifest()
+    pages.render_pages()
+    order_writer.start()
+    traffic_capture.start()
+    background_tasks = [
+        asyncio.create_task(cleanup_inactive_sessions()),
+        asyncio.create_task(menu_catalog.refresh_menu_periodically()),
+    ]
     try:
         yield
     finally:
         # Shutdown
-        cleanup_task.cancel()
-        try:
-            await cleanup_task
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logging.info(f"Unexpected error during shutdown: {e}")
+        for task in background_tasks:
+            task.cancel()
+        for task in background_tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error("Unexpected error during shutdown: %s", e)
+        await idempotency.drain()  # Let the webhook turns still running finish
+        await order_writer.stop()
+        await traffic_capture.stop()
+        await session_store.close()
+        await db_helper.close_db_pool()
 
 # Create a FastAPI app instance
 app = FastAPI(lifespan=lifespan)
 
 # Mount the static files directory
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-
-# Configure Jinja2 templates
-templates = Jinja2Templates(directory="app/templates")
+# Built assets (python -m app.static_assets), fingerprinted and cached for a year
+app.mount(static_assets.ASSETS_URL, static_assets.AssetFiles(directory=static_assets.DIST_DIR, check_dir=False), name="assets")
 
 @app.get("/")
 async def read_root(request: Request):
     """
-    Render the index.html template.
+    Serve the pre-rendered index.html page.
     """
-    return templates.TemplateResponse("index.html", {"request": request})
+    return pages.page_response(request, "index.html")
 
 @app.get("/learn_more.html")
 async def read_learn_more(request: Request):
     """
-    Render the learn_more.html template.
+    Serve the pre-rendered learn_more.html page.
+    """
+    return pages.page_response(request, "learn_more.html")
+
+@app.post("/menu/reload")
+async def reload_menu(request: Request):
+    """
+    Reload the menu from the database, keeping the current one if the reload fails. Requires the ADMIN_TOKEN.
+    """
+    require_admin_token(request)
+    reloaded = await menu_catalog.load_menu()
+    return {"reloaded": reloaded, "items": len(menu_catalog.menu_index)}
+
+@app.get("/metrics")
+async def read_metrics():
+    """
+    Expose the metrics of this worker in the Prometheus text format.
+    """
+    session_stats = await session_store.stats()
+    if "live_sessions" in session_stats:
+        metrics.active_sessions.set(session_stats["live_sessions"])
+    for reason in ("expired", "evicted"):
+        if f"{reason}_sessions" in session_stats:
+            metrics.dropped_sessions.set(session_stats[f"{reason}_sessions"], reason)
+    metrics.admission_in_flight.set(admission.in_flight_count)
+    metrics.admission_queued.set(len(admission.waiters))
+    metrics.dropped_log_records.set(log_setup.dropped_records())
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/orders/status")
+async def read_order_statuses(order_id: List[int] = Query(..., max_length=500)):
     """
-    return templates.TemplateResponse("learn_more.html", {"request": request})
+    Return the status of many orders at once, null for the orders that don't exist.
+    """
+    try:
+        statuses = await order_status.get_order_statuses(order_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"statuses": statuses}
+
+@app.post("/orders/status")
+async def ingest_order_statuses(request: Request):
+    """
+    Apply a stream of order status updates, as NDJSON ({"order_id": 42, "status": "in transit"} per line)
+    or CSV (order_id,status), and return the result of each line. Requires the ADMIN_TOKEN.
+    """
+    require_admin_token(request)
+    content_type = request.headers.get("content-type", "").partition(";")[0].strip().lower()
+    if content_type not in status_ingest.NDJSON_TYPES + status_ingest.CSV_TYPES:
+        raise HTTPException(status_code=415, detail="Send the updates as application/x-ndjson or text/csv")
+    return await status_ingest.ingest_order_statuses(request.stream(), content_type)
+
+@app.get("/reports/top-items")
+async def read_top_items(limit: int = Query(10, ge=1, le=100)):
+    """
+    Return the best selling items, read from the sales rollup.
+    """
+    try:
+        return {"items": await sales_reports.top_items(limit)}
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/reports/revenue-by-hour")
+async def read_revenue_by_hour(hours: int = Query(24, ge=1, le=24 * 366)):
+    """
+    Return the orders, items and revenue of each of the last hours, read from the sales rollup.
+    """
+    try:
+        return {"hours": await sales_reports.revenue_by_hour(hours)}
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/reports/basket-size")
+async def read_basket_size(hours: int = Query(24, ge=1, le=24 * 366)):
+    """
+    Return the average basket size over the last hours, read from the sales rollup.
+    """
+    try:
+        return await sales_reports.basket_size(hours)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 # Define a route for the webhook endpoint
 @app.post("/")
@@ -93,154 +205,143 @@ async def webhook_handler(request: Request):
     Handles incoming webhook requests, extracts necessary information, 
     and delegates processing to the appropriate handler
     """
+    deadline = time.monotonic() + admission.WEBHOOK_BUDGET
+    received = time.perf_counter()
+    webhook_request = None
     try:
-        # Retrieve the JSON data from the incoming webhook request
-        payload = await request.json()
-
-        # Extract the necessary information from the payload
-        query_result = payload.get('queryResult', {})
-        intent_name = query_result.get('intent', {}).get('displayName', '')
-        parameters = query_result.get('parameters', {})
-
-        # Extract the session id
-        outputs_contexts = query_result.get('outputContexts', [{}])[0].get('name', '')
-        session_id = await generic_helper.extract_session_id(outputs_contexts)
-        logging.info(f"My Session: {session_id}")  # Debugging
-
-        # Map intent names to their respective handler functions
-        intent_handlers = {
-            'new.order': new_order,
-            'order.add - context: ongoing-order': add_item_to_order,
-            'order.remove - context: ongoing-order': remove_item_from_order,
-            'order.prompt_confirm - context: ongoing-order': prompt_confirm_order,
-            'order.cancel - context: ongoing-order': cancel_order,
-            'order.complete - context: ongoing-order': complete_order,
-            'track.order - context: ongoing-tracking': track_order,
-        }
+        # Decode the raw body of the webhook request into the fields the handlers need
+        try:
+            webhook_request = webhook_payload.decode_webhook_request(await request.body())
+        except webhook_payload.MalformedPayload as e:
+            logger.warning("Malformed webhook request: %s", e)
+            response = responses.webhook_error()
+            response.status_code = 400
+            return response
 
-        # Call the appropriate handler function based on the intent name
-        if intent_name in intent_handlers:
-            logging.info(f"Webhook call: {intent_name} is successful.")  # Debugging
-            return await intent_handlers[intent_name](session_id, parameters)
+        session_id = webhook_request.session_id
+        logger.debug("My Session: %s", session_id)
 
-        # Default response if the intent is not recognized
-        return {"fulfillmentText": "Sorry, I didn't understand that request."}
+        # Call the appropriate handler function based on the intent name
+        handler = INTENT_HANDLERS.get(webhook_request.intent_name)
+        if handler is not None:
+            logger.debug("Webhook call: %s is successful.", webhook_request.intent_name)
+            start = time.perf_counter()
+
+            async def handle():
+                if handler in DB_BOUND_HANDLERS:
+                    return await admission.run_admitted(deadline, handler, session_id, webhook_request.parameters)
+                return await handler(session_id, webhook_request.parameters)
+
+            try:
+                # Dialogflow retries reuse the responseId, answer them without running the handler again, on any worker
+                response = await idempotency.run_once(webhook_request.response_id, session_id, handle, session_store)
+            except admission.Overloaded:
+                # Not stored for the retries, which get another chance
+                response = responses.overloaded()
+            finally:
+                metrics.webhook_latency.observe(time.perf_counter() - start, webhook_request.intent_name)
+        else:
+            # Default response if the intent is not recognized
+            response = responses.unknown_intent()
     except Exception as e:
-        logging.info(f"Error in webhook_handler: {e}")
-        return {"fulfillmentText": "❗There was an error processing the request. Please try again."}
+        logger.error("Error in webhook_handler: %s", e)
+        metrics.handler_errors.inc("webhook_handler")
+        response = responses.webhook_error()
+
+    if webhook_request is not None:
+        traffic_capture.record(webhook_request, response, time.perf_counter() - received)
+    return response
 
 @print_orders_sessions
-async def new_order(session_id: str, parameters: dict = None) -> dict:
+async def new_order(session_id: str, parameters: dict = None) -> FulfillmentResponse:
     """
     Starts a new order or retrieves an existing order for the session
     """
     try:
-        if session_id in active_orders_sessions and active_orders_sessions[session_id]:
-            order_items_qty = await generic_helper.get_order_items_qty(active_orders_sessions, session_id)
+        current_order = await session_store.get_cart(session_id)
+        if current_order:
+            order_items_qty = await generic_helper.get_order_items_qty(current_order)
             fulfillment_text = f"🛒 You have an existing order: {order_items_qty}. Do you need something else?"
-            options = [{"text": "Yes"}, {"text": "No"}, {"text": "Show Menu 📋"}]
-        else:
-            fulfillment_text = "New order started 🛒. What can I get for you?"
-            options = [{"text": "Show Menu 📋"}]
-
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": [fulfillment_text]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": options}]]}}
-            ]
-        }
+            return responses.message(fulfillment_text, responses.YES_NO_SHOW_MENU)
+
+        return responses.new_order_started()
     except Exception as e:
-        logging.info(f"Error in new_order: {e}")
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error tracking the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
+        logger.error("Error in new_order: %s", e)
+        metrics.handler_errors.inc("new_order")
+        return responses.new_order_error()
 
 @print_orders_sessions
-async def add_item_to_order(session_id: str, parameters: dict) -> dict:
+async def add_item_to_order(session_id: str, parameters: dict) -> FulfillmentResponse:
     """
     Adds items to the current order for the session
     """
     try:
-        current_time = time.time()  # Track current time
         food_items = parameters.get('food-item', [])
         add_qty = parameters.get('qty', [])
 
         if len(food_items) != len(add_qty):
-            return {
-                "fulfillmentMessages": [
-                    {"text": {"text": ["Please specify items and quantities 🍣 (e.g., 2 Tuna Sushi, 1 Chirasi)."]}}
-                ]
-            }
+            return responses.items_qty_mismatch()
 
         add_qty = [int(q) for q in add_qty]  # Convert quantities to integers
         food_dict = dict(zip(food_items, add_qty))  # Create the food dictionary
 
-        valid_food_items = {item: qty for item, qty in food_dict.items() if await db_helper.does_food_item_exist(item)}
-        non_existing_items = [item for item in food_dict if item not in valid_food_items]
+        # Map the names to the menu items, tolerating case, accents, plurals and typos
+        valid_food_items = {}
+        non_existing_items = []
+        for item, qty in food_dict.items():
+            menu_item = menu_catalog.resolve_food_item(item)
+            if menu_item is None:
+                non_existing_items.append(item)
+            else:
+                valid_food_items[menu_item] = qty
 
-        logging.info(f"Valid Food Items: {valid_food_items} - Non-existing Food Items: {non_existing_items} ")  # Debugging
+        logger.debug("Valid Food Items: %s - Non-existing Food Items: %s", valid_food_items, non_existing_items)
 
         fulfillment_text = ""
         if non_existing_items:
             fulfillment_text += f"Sorry, these items aren't available: 🚫{', '.join(non_existing_items)}."
+            suggestions = list(dict.fromkeys(name for item in non_existing_items for name in menu_catalog.suggest_food_items(item)))
+            if suggestions:
+                fulfillment_text += f" Did you mean: {', '.join(suggestions)}?"
 
         if valid_food_items:
-            if session_id in active_orders_sessions:
-                active_orders_sessions[session_id].update(valid_food_items)
-            else:
-                active_orders_sessions[session_id] = valid_food_items
-
-            logging.info(f"Order: {active_orders_sessions[session_id]}")  # Debugging
-            last_activity_times[session_id] = current_time  # Update the last activity time
+            current_order = await session_store.update_cart(session_id, valid_food_items)
+            metrics.cart_size.observe(len(current_order))
+            logger.debug("Order: %s", current_order)
+        else:
+            current_order = await session_store.get_cart(session_id)
 
-        order_items_qty = await generic_helper.get_order_items_qty(active_orders_sessions, session_id)
+        order_items_qty = await generic_helper.get_order_items_qty(current_order)
         fulfillment_text += f" So far, you have in your cart: 🛒 {order_items_qty}. Do you need something else?"
 
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": [fulfillment_text]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Yes"}, {"text": "No"}, {"text": "Show Menu"}]}]]}}
-            ]
-        }
+        return responses.message(fulfillment_text, responses.YES_NO_SHOW_MENU_PLAIN)
     except Exception as e:
-        logging.info(f"Error in add_item_to_order: {e}")
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error adding items to the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
+        logger.error("Error in add_item_to_order: %s", e)
+        metrics.handler_errors.inc("add_item_to_order")
+        return responses.add_items_error()
 
-async def remove_item_from_order(session_id: str, parameters: dict) -> dict:
+async def remove_item_from_order(session_id: str, parameters: dict) -> FulfillmentResponse:
     """
     Removes items from the current order for the session
     """
     try:
-        if session_id not in active_orders_sessions:
-            return {
-                "fulfillmentMessages": [
-                    {"text": {"text": ["Couldn't find an active order. Please start a new one 🍣."]}},
-                    {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "New Order 🛒"}, {"text": "Show Menu 📋"}]}]]}}
-                ]
-            }
-
-        current_order = active_orders_sessions.get(session_id)  # Retrieve the current order
         items_to_remove = parameters.get('food-item', [])  # Extract the food items to remove
 
-        removed_items = [item for item in items_to_remove if item in current_order]
-        not_found_items = [item for item in items_to_remove if item not in current_order]
+        # Map the names to the menu items, tolerating case, accents, plurals and typos
+        menu_items = {item: menu_catalog.resolve_food_item(item) for item in items_to_remove}
+        non_existing_items_in_db = [item for item, menu_item in menu_items.items() if menu_item is None]
+        menu_items_to_remove = list(dict.fromkeys(menu_item for menu_item in menu_items.values() if menu_item is not None))
 
-        logging.info(f"Items not found: {not_found_items} - Items removed: {removed_items}")  # Debugging
-        logging.info(f"Order Updated:{current_order}")  # Debugging
+        removal = await session_store.remove_items(session_id, menu_items_to_remove)
+        if removal is None:
+            return responses.no_active_order()
 
-        for item in removed_items:
-            del current_order[item]
+        removed_items, current_order = removal
+        metrics.cart_size.observe(len(current_order))
+        existing_items_in_db = [menu_item for menu_item in menu_items_to_remove if menu_item not in removed_items]
 
-        existing_items_in_db = [item for item in not_found_items if await db_helper.does_food_item_exist(item)]
-        non_existing_items_in_db = [item for item in not_found_items if not await db_helper.does_food_item_exist(item)]
+        logger.debug("Items not found: %s - Items removed: %s", existing_items_in_db + non_existing_items_in_db, removed_items)
+        logger.debug("Order Updated: %s", current_order)
 
         fulfillment_text = ""
         if non_existing_items_in_db:
@@ -253,184 +354,106 @@ async def remove_item_from_order(session_id: str, parameters: dict) -> dict:
         if not current_order:
             fulfillment_text += " Your order is empty. Do you need something else?"
         else:
-            order_items_qty = await generic_helper.get_order_items_qty(active_orders_sessions, session_id)
+            order_items_qty = await generic_helper.get_order_items_qty(current_order)
             fulfillment_text += f" So far, you have in your cart: 🍣 {order_items_qty}. Do you need something else?"
 
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": [fulfillment_text]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Yes"}, {"text": "No"}, {"text": "Show the menu 📋"}]}]]}}
-            ]
-        }
+        return responses.message(fulfillment_text, responses.YES_NO_SHOW_THE_MENU)
     except Exception as e:
-        logging.info(f"Error in remove_item_from_order: {e}")
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error removing items from the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
+        logger.error("Error in remove_item_from_order: %s", e)
+        metrics.handler_errors.inc("remove_item_from_order")
+        return responses.remove_items_error()
 
-async def prompt_confirm_order(session_id: str, parameters: dict) -> dict:
+async def prompt_confirm_order(session_id: str, parameters: dict) -> FulfillmentResponse:
     """
     Prompts the user to confirm the order
     """
     try:
-        if session_id not in active_orders_sessions:
-            return {
-                "fulfillmentMessages": [
-                    {"text": {"text": ["I can't find your order. Sorry! 😔 Please place it again."]}},
-                    {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "New Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-                ]
-            }
-
-        current_order = active_orders_sessions.get(session_id)  # Retrieve the order
+        current_order = await session_store.get_cart(session_id)  # Retrieve the order
+        if current_order is None:
+            return responses.order_not_found()
 
         # Determine fulfillment text and options based on the order status
         if not current_order:
-            fulfillment_text = "Your order is empty. Do you need something else?"
-            options = [{"text": "I need something else"}, {"text": "Show Menu 📋"}]
-        else:
-            order_items_qty = await generic_helper.get_order_items_qty(active_orders_sessions, session_id)
-            fulfillment_text = f"All right! 🛒 You have {order_items_qty} in your cart. Please confirm your order."
-            options = [{"text": "Confirm ✅"}, {"text": "Cancel ❌"}]
-
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": [fulfillment_text]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": options}]]}}
-            ]
-        }
+            return responses.message("Your order is empty. Do you need something else?", responses.SOMETHING_ELSE_SHOW_MENU)
+
+        order_items_qty = await generic_helper.get_order_items_qty(current_order)
+        fulfillment_text = f"All right! 🛒 You have {order_items_qty} in your cart. Please confirm your order."
+        return responses.message(fulfillment_text, responses.CONFIRM_CANCEL)
     except Exception as e:
-        logging.info(f"Error in prompt_confirm_order: {e}")
-        return {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error confirming the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
+        logger.error("Error in prompt_confirm_order: %s", e)
+        metrics.handler_errors.inc("prompt_confirm_order")
+        return responses.confirm_order_error()
 
-async def cancel_order(session_id: str, parameters: dict) -> dict:
+async def cancel_order(session_id: str, parameters: dict) -> FulfillmentResponse:
     """
     Cancels the order for the given session
     """
     try:
-        current_order = active_orders_sessions.get(session_id)  # Retrieve the order
-
-        # Define response templates
-        empty_order_response = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["Your order is empty. Please add items to your cart."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Menu 📋"}]}]]}}
-            ]
-        }
-
-        non_empty_order_response = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["🛒Your order has not been confirmed: {order_items_qty}. Do you need something else?"]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Yes"}, {"text": "No"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
-
-        error_response = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error cancelling the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
-
+        current_order = await session_store.get_cart(session_id)  # Retrieve the order
         if not current_order:
-            return empty_order_response
-
-        order_items_qty = await generic_helper.get_order_items_qty(active_orders_sessions, session_id)
-        non_empty_order_response["fulfillmentMessages"][0]["text"]["text"][0] = non_empty_order_response["fulfillmentMessages"][0]["text"]["text"][0].format(order_items_qty=order_items_qty)
-        return non_empty_order_response
+            return responses.cancel_empty_order()
 
+        order_items_qty = await generic_helper.get_order_items_qty(current_order)
+        fulfillment_text = f"🛒Your order has not been confirmed: {order_items_qty}. Do you need something else?"
+        return responses.message(fulfillment_text, responses.YES_NO_MENU)
     except Exception as e:
-        logging.info(f"Error in cancel_order: {e}")
-        return error_response
+        logger.error("Error in cancel_order: %s", e)
+        metrics.handler_errors.inc("cancel_order")
+        return responses.cancel_order_error()
 
-async def complete_order(session_id: str, parameters: dict) -> dict:
+async def complete_order(session_id: str, parameters: dict) -> FulfillmentResponse:
     """
     Completes the order for the given session
     """
     try:
-        current_order = active_orders_sessions.get(session_id)  # Retrieve the order 
-        logging.info(f"Order to insert in db: {current_order}")  # Debugging
-
-        # Define response templates
-        empty_order_response = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["Your order is empty. Please add items to your cart before completing the order."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Menu 📋"}]}]]}}
-            ]
-        }
-
-        success_response_template = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["Awesome 🎉! We have placed your order id {order_id}. Your order total is ${total_price:.2f} which you can pay at the time of delivery 📦."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Menu 📋"}, {"text": "New order 🛒"}, {"text": "Track status 🚚"}, {"text": "Opening hours 🕒"}]}]]}}
-            ]
-        }
-
-        error_response_template = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗Error placing order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
-
-        general_error_response = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error completing the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
-            ]
-        }
+        current_order = await session_store.get_cart(session_id)  # Retrieve the order 
+        logger.debug("Order to insert in db: %s", current_order)
 
         if not current_order:
-            return empty_order_response
+            return responses.complete_empty_order()
 
         # Save the order into the database
-        new_order_id, total_order_price = await db_helper.save_order_to_db(current_order)
+        new_order_id, total_order_price = await order_writer.submit_order(current_order)
 
-        if new_order_id:
-            del active_orders_sessions[session_id]  # Clear the session
-            success_response_template["fulfillmentMessages"][0]["text"]["text"][0] = success_response_template["fulfillmentMessages"][0]["text"]["text"][0].format(order_id=new_order_id, total_price=total_order_price)
-            return success_response_template
-        else:
-            return error_response_template
+        if not new_order_id:
+            return responses.place_order_error()
 
+        await session_store.delete(session_id)  # Clear the session
+        order_status.set_order_status(new_order_id, 'in progress')
+        fulfillment_text = f"Awesome 🎉! We have placed your order id {new_order_id}. Your order total is ${total_order_price:.2f} which you can pay at the time of delivery 📦."
+        return responses.message(fulfillment_text, responses.ORDER_PLACED)
     except Exception as e:
-        logging.info(f"Error in complete_order: {e}")
-        return general_error_response
+        logger.error("Error in complete_order: %s", e)
+        metrics.handler_errors.inc("complete_order")
+        return responses.complete_order_error()
 
-async def track_order(session_id: str, parameters: dict) -> dict:
+async def track_order(session_id: str, parameters: dict) -> FulfillmentResponse:
     """
     Provide the status of a specific order ID
     """
     try:
         order_id = int(parameters['order_id'])
-        order_status = await db_helper.get_order_status(order_id)
+        status = await order_status.get_order_status(order_id)
 
         # Determine the fulfillment text based on order status
-        fulfillment_text = f"📦 The order {order_id} is {order_status}." if order_status else f"📦 The order {order_id} doesn't exist."
-
-        # Define response templates
-        response = {
-            "fulfillmentMessages": [
-                {"text": {"text": [fulfillment_text]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Menu 📋"}, {"text": "New order 🛒"}, {"text": "Order status 🚚"}, {"text": "Opening hours 🕒"}]}]]}}
-            ]
-        }
-
-        return response
-
+        fulfillment_text = f"📦 The order {order_id} is {status}." if status else f"📦 The order {order_id} doesn't exist."
+        return responses.message(fulfillment_text, responses.ORDER_TRACKED)
     except Exception as e:
-        logging.info(f"Error in track_order: {e}")
-        error_response = {
-            "fulfillmentMessages": [
-                {"text": {"text": ["❗There was an error tracking the order. Please try again."]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Status 🚚"}, {"text": "Order 🛒"}]}]]}}
-            ]
-        }
-        return error_response
+        logger.error("Error in track_order: %s", e)
+        metrics.handler_errors.inc("track_order")
+        return responses.track_order_error()
+
+# Map intent names to their respective handler functions
+INTENT_HANDLERS = {
+    'new.order': new_order,
+    'order.add - context: ongoing-order': add_item_to_order,
+    'order.remove - context: ongoing-order': remove_item_from_order,
+    'order.prompt_confirm - context: ongoing-order': prompt_confirm_order,
+    'order.cancel - context: ongoing-order': cancel_order,
+    'order.complete - context: ongoing-order': complete_order,
+    'track.order - context: ongoing-tracking': track_order,
+}
+
+# Handlers waiting on the database or the session store, admitted through app.admission
+# so a slow database sheds load instead of making every call miss Dialogflow's deadline
+DB_BOUND_HANDLERS = {add_item_to_order, remove_item_from_order, complete_order, track_order}
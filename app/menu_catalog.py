@@ -0,0 +1,57 @@
+# app/menu_catalog.py
+
+import asyncio
+import logging
+import os
+from app import db_helper
+from app.menu_resolver import MenuResolver
+
+logger = logging.getLogger(__name__)
+
+# Current menu snapshot: menu item name -> (item_id, price), and the resolver for the names users type.
+# They are replaced together on every successful refresh, never mutated in place.
+menu_index = {}
+menu_resolver = MenuResolver([])
+
+async def load_menu() -> bool:
+    """
+    Load the food_items table into a new snapshot and swap it in,
+    and return a bool: True if the snapshot was refreshed, False if the last good one was kept.
+    """
+    global menu_index, menu_resolver
+    rows = await db_helper.get_food_items()
+    if rows is None:
+        logger.warning("Menu refresh failed, keeping the last loaded menu.")
+        return False
+
+    new_menu_index = {name: (item_id, price) for item_id, name, price in rows if name}
+    new_menu_resolver = MenuResolver(new_menu_index)
+    menu_index, menu_resolver = new_menu_index, new_menu_resolver
+    logger.info("Menu loaded with %s items.", len(menu_index))
+    return True
+
+async def refresh_menu_periodically():
+    """
+    Periodically reloads the menu so changes to food_items are picked up without a restart.
+    Retries sooner while no menu has been loaded yet (e.g. the database was down at startup).
+    """
+    interval = float(os.getenv('MENU_REFRESH_INTERVAL', 60 * 5))
+    while True:
+        await asyncio.sleep(interval if menu_index else 10)
+        try:
+            await load_menu()
+        except Exception as e:
+            logger.error("Error refreshing the menu: %s", e)
+
+def resolve_food_item(food_item: str):
+    """
+    Return the menu item name the given name refers to (in any case, accents,
+    plural or with a small typo), or None if it is not on the menu.
+    """
+    return menu_resolver.resolve(food_item)
+
+def suggest_food_items(food_item: str) -> list:
+    """
+    Return the menu item names closest to a name that couldn't be resolved, best first.
+    """
+    return menu_resolver.suggest(food_item)
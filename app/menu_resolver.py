@@ -0,0 +1,99 @@
+# app/menu_resolver.py
+
+import re
+import unicodedata
+from collections import defaultdict
+
+# Similarity (Dice coefficient over trigrams) needed to resolve a name to a menu item,
+# and how far ahead of the runner-up the best match must be
+RESOLVE_THRESHOLD = 0.6
+RESOLVE_MARGIN = 0.1
+# Similarity needed to suggest a menu item for a name that couldn't be resolved
+SUGGEST_THRESHOLD = 0.4
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a food item name: case and accent insensitive, punctuation and extra spaces removed.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.strip())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return " ".join(re.findall(r"\w+", folded))
+
+def singularize(word: str) -> str:
+    """
+    Strip the common English plural endings of a word.
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("es") and word[:-2].endswith(("s", "x", "ch", "sh")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def match_key(name: str) -> str:
+    """
+    Return the key under which two spellings of the same item are equal.
+    """
+    return " ".join(singularize(word) for word in normalize_name(name).split())
+
+def trigrams(key: str) -> set:
+    """
+    Return the trigrams of a match key, padded so word starts weigh more.
+    """
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class MenuResolver:
+    """
+    Maps the names users type to the canonical menu item names, using exact match keys
+    first and a trigram index for misspellings. Built once per menu snapshot.
+    """
+    def __init__(self, names):
+        self.names = []
+        self.exact = {}
+        self.trigram_sizes = []
+        self.trigram_index = defaultdict(list)  # trigram -> indexes of the names containing it
+        for name in names:
+            key = match_key(name)
+            if not key or key in self.exact:
+                continue
+            self.exact[key] = name
+            name_trigrams = trigrams(key)
+            for trigram in name_trigrams:
+                self.trigram_index[trigram].append(len(self.names))
+            self.trigram_sizes.append(len(name_trigrams))
+            self.names.append(name)
+
+    def rank(self, text: str, threshold: float) -> list:
+        """
+        Return a list of tuples: (Similarity, Menu item name) for the items at least that similar, best first.
+        Only the items sharing a trigram with the text are scored.
+        """
+        text_trigrams = trigrams(match_key(text))
+        shared = defaultdict(int)
+        for trigram in text_trigrams:
+            for index in self.trigram_index.get(trigram, ()):
+                shared[index] += 1
+        scored = [(2 * count / (len(text_trigrams) + self.trigram_sizes[index]), self.names[index]) for index, count in shared.items()]
+        return sorted((match for match in scored if match[0] >= threshold), reverse=True)
+
+    def resolve(self, text: str):
+        """
+        Return the menu item name the text refers to, or None if there's no clear match.
+        """
+        name = self.exact.get(match_key(text))
+        if name is not None:
+            return name
+        matches = self.rank(text, SUGGEST_THRESHOLD)
+        if not matches or matches[0][0] < RESOLVE_THRESHOLD:
+            return None
+        if len(matches) > 1 and matches[0][0] - matches[1][0] < RESOLVE_MARGIN:
+            return None
+        return matches[0][1]
+
+    def suggest(self, text: str, limit: int = 3) -> list:
+        """
+        Return up to limit menu item names close to the text, best first.
+        """
+        return [name for _, name in self.rank(text, SUGGEST_THRESHOLD)[:limit]]
@@ -0,0 +1,119 @@
+# app/metrics.py
+
+from bisect import bisect_left
+
+# Metrics exposed on /metrics, in registration order
+registry = []
+
+# Upper bounds (seconds) of the latency buckets, up to Dialogflow's 5 second webhook deadline
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _labels(label_name, label_value, extra: str = "") -> str:
+    """
+    Format the label set of a sample.
+    """
+    pairs = []
+    if label_name is not None:
+        escaped = str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{label_name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """
+    Monotonic counter, optionally split by one label.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_name: str = None):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, label_value=None, amount: float = 1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def set(self, value: float, label_value=None):
+        """
+        Copy the value of a counter maintained elsewhere.
+        """
+        self.values[label_value] = value
+
+    def samples(self):
+        for label_value, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_name, label_value)} {value}"
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, optionally split by one label.
+    """
+    kind = "gauge"
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, optionally split by one label.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_name: str = None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self.values = {}  # label value -> [bucket counts..., +Inf count, sum]
+        registry.append(self)
+
+    def observe(self, value: float, label_value=None):
+        counts = self.values.get(label_value)
+        if counts is None:
+            counts = self.values[label_value] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for label_value, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_name, label_value, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_name, label_value)} {counts[-1]}"
+            yield f"{self.name}_count{_labels(self.label_name, label_value)} {cumulative}"
+
+def render_metrics() -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+# Webhook
+webhook_latency = Histogram("webhook_request_duration_seconds", "Time to answer a webhook call, per intent.", "intent")
+handler_errors = Counter("webhook_handler_errors_total", "Errors caught by the intent handlers.", "handler")
+shed_requests = Counter("webhook_shed_total", "Webhook calls answered with a try-again reply instead of being run, by reason.", "reason")
+admission_in_flight = Gauge("webhook_admission_in_flight", "Database-bound webhook calls running.")
+admission_queued = Gauge("webhook_admission_queued", "Database-bound webhook calls waiting for a slot.")
+captured_requests = Counter("webhook_captured_total", "Webhook calls written to the traffic capture, or dropped when it fell behind.", "result")
+
+# Database
+db_query_latency = Histogram("db_query_duration_seconds", "Time spent in a database operation, connection included.", "operation")
+db_query_errors = Counter("db_query_errors_total", "Database operations that failed.", "operation")
+db_acquire_latency = Histogram("db_connection_acquire_seconds", "Time to get a connection from the pool.")
+
+# Sessions
+active_sessions = Gauge("sessions_active", "Sessions with an active order.")
+dropped_sessions = Counter("sessions_dropped_total", "Sessions dropped by the session store, by reason (expired or evicted).", "reason")
+cart_size = Histogram("cart_size_items", "Distinct items in a cart after it changed.", buckets=(1, 2, 3, 5, 10, 20))
+
+# Orders
+status_updates = Counter("order_status_updates_total", "Order status updates received in bulk, by result.", "result")
+
+# Logging
+dropped_log_records = Counter("log_records_dropped_total", "Log records dropped because the log writer fell behind.")
@@ -0,0 +1,89 @@
+# app/order_status.py
+
+import os
+import time
+from app import db_helper
+
+# Seconds a known status, and a missing order, stay cached
+ORDER_STATUS_TTL = float(os.getenv('ORDER_STATUS_TTL', 10))
+ORDER_STATUS_MISSING_TTL = float(os.getenv('ORDER_STATUS_MISSING_TTL', 5))
+ORDER_STATUS_CACHE_SIZE = int(os.getenv('ORDER_STATUS_CACHE_SIZE', 10_000))
+
+# Statuses an order goes through, from checkout to delivery
+ORDER_STATUSES = ("in progress", "in transit", "delivered")
+
+# order_id -> (status or None if the order doesn't exist, expiry time), oldest entries first
+status_cache = {}
+
+def _cache_status(order_id: int, status):
+    """
+    Cache the status of an order, or its absence if status is None.
+    """
+    ttl = ORDER_STATUS_TTL if status is not None else ORDER_STATUS_MISSING_TTL
+    status_cache.pop(order_id, None)
+    status_cache[order_id] = (status, time.monotonic() + ttl)
+    if len(status_cache) > ORDER_STATUS_CACHE_SIZE:
+        del status_cache[next(iter(status_cache))]
+
+def _cached_status(order_id: int):
+    """
+    Return a tuple: (True, Status or None) if the order is cached, (False, None) otherwise.
+    """
+    entry = status_cache.get(order_id)
+    if entry is None:
+        return False, None
+    status, expires_at = entry
+    if expires_at < time.monotonic():
+        del status_cache[order_id]
+        return False, None
+    return True, status
+
+def set_order_status(order_id: int, status: str):
+    """
+    Record a status just written to the database, replacing any cached value.
+    """
+    _cache_status(order_id, status)
+
+def invalidate(order_id: int):
+    """
+    Forget the cached status of an order.
+    """
+    status_cache.pop(order_id, None)
+
+async def get_order_status(order_id: int):
+    """
+    Get the status of an order through the cache,
+    and return a str: The status of the order, or None if not found.
+    """
+    hit, status = _cached_status(order_id)
+    if hit:
+        return status
+    found = await db_helper.get_order_statuses([order_id])
+    if found is None:
+        return None  # Don't cache a failed read as a missing order
+    status = found.get(order_id)
+    _cache_status(order_id, status)
+    return status
+
+async def get_order_statuses(order_ids: list) -> dict:
+    """
+    Get the status of many orders, reading the uncached ones in a single query,
+    and return a dict: order_id -> Status, or None if not found.
+    """
+    statuses = {}
+    missing_ids = []
+    for order_id in order_ids:
+        hit, status = _cached_status(order_id)
+        if hit:
+            statuses[order_id] = status
+        else:
+            missing_ids.append(order_id)
+
+    if missing_ids:
+        found = await db_helper.get_order_statuses(missing_ids)
+        if found is None:
+            raise RuntimeError("Couldn't read the order statuses")
+        for order_id in missing_ids:
+            statuses[order_id] = found.get(order_id)
+            _cache_status(order_id, statuses[order_id])
+    return statuses
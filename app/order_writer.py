@@ -0,0 +1,122 @@
+# app/order_writer.py
+
+import asyncio
+import logging
+import os
+from app import db_helper
+
+logger = logging.getLogger(__name__)
+
+# Checkouts arriving within this window (or until the batch is full) are saved in one transaction
+ORDER_BATCH_WINDOW = float(os.getenv('ORDER_BATCH_WINDOW_MS', 5)) / 1000
+ORDER_BATCH_MAX_SIZE = int(os.getenv('ORDER_BATCH_MAX_SIZE', 50))
+# Batches being committed at the same time
+ORDER_BATCH_WRITERS = int(os.getenv('ORDER_BATCH_WRITERS', 2))
+
+# Pending (order, future) pairs, created by start()
+order_queue = None
+writer_task = None
+
+async def save_order_alone(order: dict) -> tuple:
+    """
+    Save an order in its own transaction, and return a tuple: (The new order ID, Total order price), (0, 0) on failure.
+    """
+    try:
+        return await db_helper.save_order_to_db(order)
+    except Exception as e:
+        logger.error("Error saving order: %s", e)
+        return 0, 0
+
+async def flush_batch(batch: list):
+    """
+    Save a batch of (order, future) pairs in one round trip, priced by the database, and resolve
+    each future with its own (order ID, total order price). An order with an unknown item doesn't
+    fail the others. If the call fails every order gets (0, 0): the batch may have been committed
+    before the error, so saving the orders again could place them twice.
+    """
+    try:
+        results = await db_helper.save_orders_to_db([order for order, _ in batch])
+    except Exception as e:
+        logger.error("Error saving a batch of orders: %s", e)
+        results = None
+    if results is None:
+        logger.warning("Saving a batch of %s orders failed.", len(batch))
+        results = [(0, 0)] * len(batch)
+
+    for result, (_, future) in zip(results, batch):
+        if not future.done():
+            future.set_result(result)
+
+async def write_orders():
+    """
+    Collects the submitted orders into batches and saves each batch in one transaction.
+    """
+    loop = asyncio.get_running_loop()
+    writers = asyncio.Semaphore(ORDER_BATCH_WRITERS)
+    flushes = set()
+    batch = []
+    try:
+        while True:
+            batch = [await order_queue.get()]
+            deadline = loop.time() + ORDER_BATCH_WINDOW
+            while len(batch) < ORDER_BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(order_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await writers.acquire()
+            flush = asyncio.create_task(flush_batch(batch))
+            flushes.add(flush)
+            flush.add_done_callback(lambda task: (flushes.discard(task), writers.release()))
+            batch = []
+    finally:
+        # Let the batches already collected finish on shutdown
+        if batch:
+            await flush_batch(batch)
+        if flushes:
+            await asyncio.gather(*flushes, return_exceptions=True)
+
+async def submit_order(order: dict) -> tuple:
+    """
+    Queue an order for the next batch and wait until it is saved,
+    and return a tuple: (The new order ID, Total order price) if the operation is successful, (0, 0) otherwise.
+    Saves the order directly if the writer isn't running.
+    """
+    if writer_task is None or writer_task.done():
+        return await save_order_alone(order)
+    future = asyncio.get_running_loop().create_future()
+    order_queue.put_nowait((dict(order), future))
+    return await future
+
+def start():
+    """
+    Start the background writer.
+    """
+    global order_queue, writer_task
+    order_queue = asyncio.Queue()
+    writer_task = asyncio.create_task(write_orders())
+
+async def stop():
+    """
+    Stop the background writer, saving the orders still queued.
+    """
+    global writer_task
+    if writer_task is None:
+        return
+    writer_task.cancel()
+    try:
+        await writer_task
+    except asyncio.CancelledError:
+        pass
+    writer_task = None
+
+    # Orders queued but not collected yet are saved one by one
+    while not order_queue.empty():
+        order, future = order_queue.get_nowait()
+        result = await save_order_alone(order)
+        if not future.done():
+            future.set_result(result)
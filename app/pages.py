@@ -0,0 +1,66 @@
+# app/pages.py
+
+import gzip
+import hashlib
+from typing import NamedTuple
+from fastapi import Request, Response
+from fastapi.templating import Jinja2Templates
+from app import static_assets
+
+# Landing pages rendered once at startup and served from memory
+PAGE_NAMES = ("index.html", "learn_more.html")
+
+templates = Jinja2Templates(directory="app/templates")
+templates.env.globals.update(asset_url=static_assets.asset_url, asset_srcset=static_assets.asset_srcset)
+
+class RenderedPage(NamedTuple):
+    body: bytes
+    gzip_body: bytes
+    etag: str
+
+# Template name -> RenderedPage
+rendered_pages = {}
+
+def render_page(name: str) -> RenderedPage:
+    """
+    Render a page and keep it with its gzip variant and ETag, and return the RenderedPage.
+    """
+    body = templates.get_template(name).render().encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    page = rendered_pages[name] = RenderedPage(body, gzip.compress(body, compresslevel=9, mtime=0), etag)
+    return page
+
+def render_pages():
+    """
+    Render every landing page, after the asset manifest is loaded so they link the built assets.
+    """
+    for name in PAGE_NAMES:
+        render_page(name)
+
+def _gzip_etag(etag: str) -> str:
+    """
+    Return the ETag of the gzip variant, distinct since its bytes differ.
+    """
+    return etag[:-1] + '-gzip"'
+
+def page_response(request: Request, name: str) -> Response:
+    """
+    Answer a request for a rendered page: 304 if the client's copy is current,
+    the gzip variant if the client accepts it, the plain page otherwise.
+    """
+    page = rendered_pages.get(name) or render_page(name)
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    etag = _gzip_etag(page.etag) if use_gzip else page.etag
+    # Browsers revalidate on every visit, so a new deploy shows at once and an unchanged page costs a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in client_etags or client_etags & {page.etag, _gzip_etag(page.etag)}:
+            return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(page.gzip_body, media_type="text/html; charset=utf-8", headers=headers)
+    return Response(page.body, media_type="text/html; charset=utf-8", headers=headers)
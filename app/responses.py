@@ -0,0 +1,83 @@
+# app/responses.py
+
+import orjson
+from fastapi import Response
+
+class FulfillmentResponse(Response):
+    """
+    Webhook reply whose JSON body is already serialized.
+    """
+    media_type = "application/json"
+
+# Serialized start of every fulfillment reply, up to the fulfillment text
+MESSAGE_PREFIX = b'{"fulfillmentMessages":[{"text":{"text":['
+
+def chips(*labels: str) -> bytes:
+    """
+    Serialize once the end of a fulfillment reply carrying the given chips,
+    and return the bytes that follow the fulfillment text.
+    """
+    if not labels:
+        return b"]}}]}"
+    payload = {"payload": {"richContent": [[{"type": "chips", "options": [{"text": label} for label in labels]}]]}}
+    return b"]}}," + orjson.dumps(payload) + b"]}"
+
+def message_bytes(text: str, chips_suffix: bytes) -> bytes:
+    """
+    Return the serialized fulfillment reply for the given text and chips.
+    """
+    return MESSAGE_PREFIX + orjson.dumps(text) + chips_suffix
+
+def message(text: str, chips_suffix: bytes) -> FulfillmentResponse:
+    """
+    Build the fulfillment reply for a text computed per request.
+    """
+    return FulfillmentResponse(message_bytes(text, chips_suffix))
+
+def static_reply(body: bytes):
+    """
+    Return a function building the response for a reply body that never changes.
+    """
+    return lambda: FulfillmentResponse(body)
+
+def static_message(text: str, chips_suffix: bytes):
+    """
+    Serialize once a fulfillment reply that never changes, and return a function building its response.
+    """
+    return static_reply(message_bytes(text, chips_suffix))
+
+# Chips shown with the replies
+NO_CHIPS = chips()
+SHOW_MENU = chips("Show Menu 📋")
+MENU = chips("Menu 📋")
+ORDER_MENU = chips("Order 🛒", "Menu 📋")
+NEW_ORDER_SHOW_MENU = chips("New Order 🛒", "Show Menu 📋")
+NEW_ORDER_MENU = chips("New Order 🛒", "Menu 📋")
+YES_NO_SHOW_MENU = chips("Yes", "No", "Show Menu 📋")
+YES_NO_SHOW_MENU_PLAIN = chips("Yes", "No", "Show Menu")
+YES_NO_SHOW_THE_MENU = chips("Yes", "No", "Show the menu 📋")
+YES_NO_MENU = chips("Yes", "No", "Menu 📋")
+SOMETHING_ELSE_SHOW_MENU = chips("I need something else", "Show Menu 📋")
+CONFIRM_CANCEL = chips("Confirm ✅", "Cancel ❌")
+ORDER_PLACED = chips("Menu 📋", "New order 🛒", "Track status 🚚", "Opening hours 🕒")
+ORDER_TRACKED = chips("Menu 📋", "New order 🛒", "Order status 🚚", "Opening hours 🕒")
+STATUS_ORDER = chips("Status 🚚", "Order 🛒")
+
+# Replies that never change
+unknown_intent = static_reply(orjson.dumps({"fulfillmentText": "Sorry, I didn't understand that request."}))
+webhook_error = static_reply(orjson.dumps({"fulfillmentText": "❗There was an error processing the request. Please try again."}))
+overloaded = static_reply(orjson.dumps({"fulfillmentText": "⏳ We're very busy right now. Please try again in a moment."}))
+new_order_started = static_message("New order started 🛒. What can I get for you?", SHOW_MENU)
+new_order_error = static_message("❗There was an error tracking the order. Please try again.", ORDER_MENU)
+items_qty_mismatch = static_message("Please specify items and quantities 🍣 (e.g., 2 Tuna Sushi, 1 Chirasi).", NO_CHIPS)
+add_items_error = static_message("❗There was an error adding items to the order. Please try again.", ORDER_MENU)
+no_active_order = static_message("Couldn't find an active order. Please start a new one 🍣.", NEW_ORDER_SHOW_MENU)
+remove_items_error = static_message("❗There was an error removing items from the order. Please try again.", ORDER_MENU)
+order_not_found = static_message("I can't find your order. Sorry! 😔 Please place it again.", NEW_ORDER_MENU)
+confirm_order_error = static_message("❗There was an error confirming the order. Please try again.", ORDER_MENU)
+cancel_empty_order = static_message("Your order is empty. Please add items to your cart.", MENU)
+cancel_order_error = static_message("❗There was an error cancelling the order. Please try again.", ORDER_MENU)
+complete_empty_order = static_message("Your order is empty. Please add items to your cart before completing the order.", MENU)
+place_order_error = static_message("❗Error placing order. Please try again.", ORDER_MENU)
+complete_order_error = static_message("❗There was an error completing the order. Please try again.", ORDER_MENU)
+track_order_error = static_message("❗There was an error tracking the order. Please try again.", STATUS_ORDER)
@@ -0,0 +1,107 @@
+# app/sales_reports.py
+"""
+Sales reports, read from the rollup tables kept up to date by the checkouts.
+
+Usage: python -m app.sales_reports [--rebuild]
+Compares the rollups with the orders, and with --rebuild replaces them with the recomputed ones.
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+from app import db_helper
+
+logger = logging.getLogger(__name__)
+
+async def top_items(limit: int) -> list:
+    """
+    Return a list of dicts: the best selling items, by quantity sold.
+    Raises RuntimeError if the rollup can't be read.
+    """
+    rows = await db_helper.get_top_selling_items(limit)
+    if rows is None:
+        raise RuntimeError("The sales rollup is unavailable")
+    return [
+        {"item_id": item_id, "name": name, "quantity": quantity, "revenue": revenue, "orders": order_count}
+        for item_id, name, quantity, revenue, order_count in rows
+    ]
+
+async def _hourly_sales(hours: int) -> list:
+    """
+    Return the rows of the hourly sales rollup for the last hours, the current one included.
+    """
+    since = db_helper.sales_hour(datetime.now()) - timedelta(hours=hours - 1)
+    rows = await db_helper.get_sales_by_hour(since)
+    if rows is None:
+        raise RuntimeError("The sales rollup is unavailable")
+    return rows
+
+async def revenue_by_hour(hours: int) -> list:
+    """
+    Return a list of dicts: the orders, items and revenue of each of the last hours that had sales.
+    Raises RuntimeError if the rollup can't be read.
+    """
+    return [
+        {"hour": hour.isoformat(), "orders": order_count, "items": item_count, "revenue": revenue}
+        for hour, order_count, item_count, revenue in await _hourly_sales(hours)
+    ]
+
+async def basket_size(hours: int) -> dict:
+    """
+    Return a dict: the average items and revenue per order over the last hours.
+    Raises RuntimeError if the rollup can't be read.
+    """
+    rows = await _hourly_sales(hours)
+    order_count = sum(row[1] for row in rows)
+    item_count = sum(row[2] for row in rows)
+    revenue = sum(row[3] for row in rows)
+    return {
+        "orders": order_count,
+        "average_items": round(item_count / order_count, 2) if order_count else 0,
+        "average_revenue": round(revenue / order_count, 2) if order_count else 0,
+    }
+
+def compare_rollups(recomputed: tuple, stored: tuple) -> list:
+    """
+    Return a list of str: one line per rollup row that differs from the recomputed one.
+    """
+    differences = []
+    for table, expected_rows, stored_rows in zip(("sales_by_item", "sales_by_hour"), recomputed, stored):
+        for key in sorted(expected_rows.keys() | stored_rows.keys()):
+            expected, actual = expected_rows.get(key), stored_rows.get(key)
+            if expected != actual:
+                differences.append(f"{table} {key}: stored {actual}, recomputed {expected}")
+    return differences
+
+async def main(rebuild: bool) -> int:
+    """
+    Check (and rebuild if asked) the sales rollups, and return the exit status.
+    """
+    await db_helper.init_db_pool()
+    try:
+        result = await db_helper.check_sales_rollups(rebuild)
+    finally:
+        await db_helper.close_db_pool()
+    if result is None:
+        logger.error("Couldn't read the orders and the sales rollups.")
+        return 2
+
+    differences = compare_rollups(*result)
+    for difference in differences:
+        logger.warning(difference)
+    if rebuild:
+        logger.info("Rebuilt the sales rollups, %s rows were out of date.", len(differences))
+        return 0
+    if differences:
+        logger.error("%s sales rollup rows are out of date, run with --rebuild to fix them.", len(differences))
+        return 1
+    logger.info("The sales rollups match the orders.")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the sales rollups against the orders.")
+    parser.add_argument("--rebuild", action="store_true", help="replace the rollups with the ones recomputed from the orders (checkouts wait meanwhile)")
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(message)s")
+    sys.exit(asyncio.run(main(parser.parse_args().rebuild)))
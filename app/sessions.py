@@ -0,0 +1,485 @@
+# app/sessions.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import struct
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Carts are dropped after this many seconds without any activity on the session
+SESSION_TTL = int(os.getenv('SESSION_TTL', 60 * 30))
+# Most sessions kept by the memory store, the least recently active ones are evicted first
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', 100_000))
+
+class SessionStore:
+    """
+    Storage for the carts of active sessions. A cart is a dict mapping food item names to quantities.
+    Every mutation is atomic for its session, and every access refreshes the session's TTL.
+    Stores shared by all the workers also hold the claims and replies deduplicating webhook retries.
+    """
+    shared = False  # True if all the workers see the same sessions
+
+    async def get_cart(self, session_id: str):
+        """
+        Return the cart dict of the session, or None if the session has no active order.
+        """
+        raise NotImplementedError
+
+    async def peek_cart(self, session_id: str):
+        """
+        Return the cart dict of the session like get_cart, without refreshing its TTL, e.g. for logging.
+        """
+        raise NotImplementedError
+
+    async def update_cart(self, session_id: str, items: dict) -> dict:
+        """
+        Set the quantities of the given items, creating the session if needed, and return the updated cart.
+        """
+        raise NotImplementedError
+
+    async def remove_items(self, session_id: str, items: list):
+        """
+        Remove the given items from the cart,
+        and return a tuple: (Removed items, Updated cart), or None if the session has no active order.
+        """
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        """
+        Drop the session and its cart.
+        """
+        raise NotImplementedError
+
+    async def claim_reply(self, key: str, ttl: float) -> tuple:
+        """
+        Claim the call identified by key for this worker, unless another worker claimed it within ttl seconds,
+        and return a tuple: (True if this worker claimed it, Stored reply as (body, status code) or None while it is running).
+        Only used on shared stores.
+        """
+        raise NotImplementedError
+
+    async def save_reply(self, key: str, body: bytes, status_code: int, ttl: float):
+        """
+        Store the reply of a claimed call for its duplicates, for ttl seconds.
+        """
+        raise NotImplementedError
+
+    async def release_reply(self, key: str):
+        """
+        Drop the claim of a call that has no reply to replay, so that a retry runs it again.
+        """
+        raise NotImplementedError
+
+    async def start(self):
+        """
+        Prepare the store before the first turn, e.g. restore its state.
+        """
+
+    async def cleanup(self) -> int:
+        """
+        Drop expired sessions that the backend doesn't expire by itself, and return how many were dropped.
+        """
+        return 0
+
+    async def close(self):
+        """
+        Release the resources held by the store.
+        """
+
+    async def stats(self) -> dict:
+        """
+        Return counters describing the sessions held by the store.
+        """
+        return {}
+
+# Item names of the memory store's carts, interned to small codes: name -> code, and code -> name
+item_codes = {}
+item_names = []
+
+# A session record of the memory store is one bytes object: its last activity time,
+# then its cart items packed as (item code, quantity) pairs
+RECORD_HEADER = struct.Struct("<d")
+CART_ITEM = struct.Struct("<Hi")
+
+def pack_record(last_activity: float, cart: dict, codes: dict = item_codes, names: list = item_names) -> bytes:
+    """
+    Pack a session record, interning the item names not seen yet (in the store's interning table by default).
+    """
+    packed = bytearray(RECORD_HEADER.pack(last_activity))
+    for item, quantity in cart.items():
+        code = codes.get(item)
+        if code is None:
+            code = codes[item] = len(names)
+            names.append(item)
+        packed += CART_ITEM.pack(code, quantity)
+    return bytes(packed)
+
+def record_last_activity(record: bytes) -> float:
+    """
+    Return the last activity time of a session record.
+    """
+    return RECORD_HEADER.unpack_from(record)[0]
+
+def unpack_cart(record: bytes) -> dict:
+    """
+    Return the cart dict of a session record.
+    """
+    return {item_names[code]: quantity for code, quantity in CART_ITEM.iter_unpack(memoryview(record)[RECORD_HEADER.size:])}
+
+class MemorySessionStore(SessionStore):
+    """
+    Session store kept in the process memory. Only usable with a single worker.
+    Each session is a single bytes record holding its activity time and its cart, with the item
+    names interned to small codes, rather than a dict of full item names plus a separate activity entry.
+    All sessions share the same TTL, so keeping the records in activity order makes them
+    both the expiry queue (oldest deadline first) and the LRU list used to enforce max_sessions.
+    With a journal (app.cart_journal.CartJournal), the carts survive restarts.
+    """
+    def __init__(self, ttl: int = SESSION_TTL, max_sessions: int = SESSION_MAX_SESSIONS, journal=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.journal = journal
+        self.sessions = OrderedDict()  # session_id -> Packed record, least recently active first
+        self.expired_sessions = 0
+        self.evicted_sessions = 0
+
+    def _expire(self, now: float) -> int:
+        """
+        Drop the sessions whose deadline has passed, looking only at those.
+        """
+        expired = 0
+        expired_before = now - self.ttl
+        while self.sessions:
+            session_id, record = next(iter(self.sessions.items()))
+            if record_last_activity(record) >= expired_before:
+                break
+            del self.sessions[session_id]
+            expired += 1
+        self.expired_sessions += expired
+        return expired
+
+    def _evict(self, max_sessions: int):
+        """
+        Drop the least recently active sessions beyond max_sessions.
+        """
+        while len(self.sessions) > max_sessions:
+            self.sessions.popitem(last=False)
+            self.evicted_sessions += 1
+
+    def _touch(self, session_id: str, create: bool):
+        """
+        Return the live cart of the session (empty if created as asked) and the current time,
+        and mark the session as the most recently active. Return None if there's no live session.
+        """
+        now = time.time()
+        self._expire(now)
+        record = self.sessions.get(session_id)
+        if record is None:
+            if not create:
+                return None
+            self._evict(self.max_sessions - 1)
+            return {}, now
+        self.sessions.move_to_end(session_id)
+        return unpack_cart(record), now
+
+    def _store(self, session_id: str, cart: dict, now: float):
+        self.sessions[session_id] = pack_record(now, cart)
+
+    async def get_cart(self, session_id: str):
+        touched = self._touch(session_id, create=False)
+        if touched is None:
+            return None
+        cart, now = touched
+        self._store(session_id, cart, now)
+        if self.journal is not None:
+            # A read keeps the session alive too, which must hold after a restart
+            self.journal.record_cart(session_id, now, cart)
+        return cart
+
+    async def peek_cart(self, session_id: str):
+        record = self.sessions.get(session_id)
+        if record is None or record_last_activity(record) < time.time() - self.ttl:
+            return None
+        return unpack_cart(record)
+
+    async def update_cart(self, session_id: str, items: dict) -> dict:
+        cart, now = self._touch(session_id, create=True)
+        cart.update(items)
+        self._store(session_id, cart, now)
+        if self.journal is not None:
+            self.journal.record_cart(session_id, now, cart)
+        return cart
+
+    async def remove_items(self, session_id: str, items: list):
+        touched = self._touch(session_id, create=False)
+        if touched is None:
+            return None
+        cart, now = touched
+        removed_items = [item for item in items if cart.pop(item, None) is not None]
+        self._store(session_id, cart, now)
+        if self.journal is not None:
+            self.journal.record_cart(session_id, now, cart)
+        return removed_items, cart
+
+    async def delete(self, session_id: str):
+        if self.sessions.pop(session_id, None) is not None and self.journal is not None:
+            self.journal.record_delete(session_id)
+
+    async def start(self):
+        if self.journal is not None:
+            if not await self.journal.restore(self):
+                self.journal = None
+                return
+            self._expire(time.time())
+            self._evict(self.max_sessions)
+            self.journal.start(self)
+
+    async def cleanup(self) -> int:
+        return self._expire(time.time())
+
+    async def close(self):
+        if self.journal is not None:
+            await self.journal.close(self)
+
+    async def stats(self) -> dict:
+        return {
+            "live_sessions": len(self.sessions),
+            "expired_sessions": self.expired_sessions,
+            "evicted_sessions": self.evicted_sessions,
+        }
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a SQLite database in WAL mode, shared by all workers on one host.
+    Queries run on a dedicated thread so they never block the event loop.
+    """
+    shared = True
+
+    def __init__(self, path: str, ttl: int = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-sessions")
+        self._db = None
+        self.expired_sessions = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, cart TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            # Claims (body NULL) and replies of the webhook calls, see app.idempotency
+            self._db.execute("CREATE TABLE IF NOT EXISTS replies (reply_key TEXT PRIMARY KEY, body BLOB, status_code INTEGER, expires_at REAL NOT NULL)")
+        return self._db
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _mutate(self, session_id: str, mutation, create: bool):
+        """
+        Apply mutation(cart) to the session's cart inside one write transaction.
+        """
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT cart FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())).fetchone()
+            if row is None and not create:
+                db.execute("ROLLBACK")
+                return None
+            cart = json.loads(row[0]) if row else {}
+            result = mutation(cart)
+            db.execute("INSERT OR REPLACE INTO sessions (session_id, cart, expires_at) VALUES (?, ?, ?)", (session_id, json.dumps(cart), time.time() + self.ttl))
+            db.execute("COMMIT")
+            return result
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _get_cart(self, session_id: str):
+        now = time.time()
+        row = self._connect().execute("UPDATE sessions SET expires_at = ? WHERE session_id = ? AND expires_at > ? RETURNING cart", (now + self.ttl, session_id, now)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_cart(self, session_id: str):
+        return await self._run(self._get_cart, session_id)
+
+    def _peek_cart(self, session_id: str):
+        row = self._connect().execute("SELECT cart FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def peek_cart(self, session_id: str):
+        return await self._run(self._peek_cart, session_id)
+
+    async def update_cart(self, session_id: str, items: dict) -> dict:
+        def mutation(cart):
+            cart.update(items)
+            return dict(cart)
+        return await self._run(self._mutate, session_id, mutation, True)
+
+    async def remove_items(self, session_id: str, items: list):
+        def mutation(cart):
+            removed_items = [item for item in items if cart.pop(item, None) is not None]
+            return removed_items, dict(cart)
+        return await self._run(self._mutate, session_id, mutation, False)
+
+    async def delete(self, session_id: str):
+        await self._run(lambda: self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)))
+
+    def _claim_reply(self, key: str, ttl: float) -> tuple:
+        db = self._connect()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM replies WHERE reply_key = ? AND expires_at <= ?", (key, now))
+            claimed = db.execute("INSERT OR IGNORE INTO replies (reply_key, expires_at) VALUES (?, ?)", (key, now + ttl)).rowcount == 1
+            row = None if claimed else db.execute("SELECT body, status_code FROM replies WHERE reply_key = ?", (key,)).fetchone()
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if row is None or row[0] is None:
+            return claimed, None
+        return False, (row[0], row[1])
+
+    async def claim_reply(self, key: str, ttl: float) -> tuple:
+        return await self._run(self._claim_reply, key, ttl)
+
+    async def save_reply(self, key: str, body: bytes, status_code: int, ttl: float):
+        await self._run(lambda: self._connect().execute(
+            "UPDATE replies SET body = ?, status_code = ?, expires_at = ? WHERE reply_key = ?", (body, status_code, time.time() + ttl, key)))
+
+    async def release_reply(self, key: str):
+        await self._run(lambda: self._connect().execute("DELETE FROM replies WHERE reply_key = ?", (key,)))
+
+    def _cleanup(self) -> int:
+        db = self._connect()
+        now = time.time()
+        db.execute("DELETE FROM replies WHERE expires_at <= ?", (now,))
+        return db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+
+    async def cleanup(self) -> int:
+        expired = await self._run(self._cleanup)
+        self.expired_sessions += expired
+        return expired
+
+    async def stats(self) -> dict:
+        live_sessions = await self._run(lambda: self._connect().execute("SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)).fetchone()[0])
+        return {"live_sessions": live_sessions, "expired_sessions": self.expired_sessions}
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store in Redis (or any server speaking the Redis protocol), shared by all workers and nodes.
+    Each cart is a hash expired by Redis itself; a marker field keeps empty carts alive.
+    """
+    SESSION_MARKER = "__session__"
+    shared = True
+
+    def __init__(self, url: str, ttl: int = SESSION_TTL, client=None):
+        if client is None:
+            import redis.asyncio as redis  # Only needed with SESSION_STORE=redis
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"cart:{session_id}"
+
+    def _to_cart(self, fields: dict):
+        if not fields:
+            return None
+        return {item: int(qty) for item, qty in fields.items() if item != self.SESSION_MARKER}
+
+    async def get_cart(self, session_id: str):
+        key = self._key(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.expire(key, self.ttl)
+            fields, _ = await pipe.execute()
+        return self._to_cart(fields)
+
+    async def peek_cart(self, session_id: str):
+        return self._to_cart(await self.client.hgetall(self._key(session_id)))
+
+    async def update_cart(self, session_id: str, items: dict) -> dict:
+        key = self._key(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={self.SESSION_MARKER: 1, **items})
+            pipe.expire(key, self.ttl)
+            pipe.hgetall(key)
+            *_, fields = await pipe.execute()
+        return self._to_cart(fields)
+
+    async def remove_items(self, session_id: str, items: list):
+        key = self._key(session_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.exists(key)
+            if items:
+                pipe.hmget(key, items)
+                pipe.hdel(key, *items)
+            pipe.expire(key, self.ttl)
+            pipe.hgetall(key)
+            results = await pipe.execute()
+        if not results[0]:
+            return None
+        previous_qty = results[1] if items else []
+        removed_items = [item for item, qty in zip(items, previous_qty) if qty is not None]
+        return removed_items, self._to_cart(results[-1]) or {}
+
+    async def delete(self, session_id: str):
+        await self.client.delete(self._key(session_id))
+
+    async def claim_reply(self, key: str, ttl: float) -> tuple:
+        reply_key = f"reply:{key}"
+        # An empty value is a claim, the reply replaces it once the call is answered
+        if await self.client.set(reply_key, "", nx=True, ex=max(1, round(ttl))):
+            return True, None
+        value = await self.client.get(reply_key)
+        if not value:
+            return False, None
+        status_code, body = json.loads(value)
+        return False, (body.encode(), status_code)
+
+    async def save_reply(self, key: str, body: bytes, status_code: int, ttl: float):
+        await self.client.set(f"reply:{key}", json.dumps([status_code, body.decode()]), ex=max(1, round(ttl)))
+
+    async def release_reply(self, key: str):
+        await self.client.delete(f"reply:{key}")
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def stats(self) -> dict:
+        # Expiry and eviction are handled by the Redis server (see its maxmemory-policy).
+        # Only the cart keys are counted, the database may be shared with other data
+        live_sessions = 0
+        async for _ in self.client.scan_iter(match=self._key("*"), count=1000):
+            live_sessions += 1
+        return {"live_sessions": live_sessions}
+
+def create_session_store() -> SessionStore:
+    """
+    Create the session store selected by the SESSION_STORE environment variable (memory, sqlite or redis).
+    The memory store keeps its carts across restarts in CART_JOURNAL_DIR, unless it is set empty.
+    """
+    backend = os.getenv('SESSION_STORE', 'memory')
+    if backend == 'sqlite':
+        return SQLiteSessionStore(os.getenv('SESSION_SQLITE_PATH', 'sessions.db'))
+    if backend == 'redis':
+        return RedisSessionStore(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    journal = None
+    journal_dir = os.getenv('CART_JOURNAL_DIR', 'cart_journal')
+    if journal_dir:
+        from app.cart_journal import CartJournal  # Imports this module
+        journal = CartJournal(journal_dir)
+    return MemorySessionStore(journal=journal)
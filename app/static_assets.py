@@ -0,0 +1,189 @@
+# app/static_assets.py
+"""
+Build step for the static assets: fingerprinted file names, gzip variants and downscaled images.
+
+Usage: python -m app.static_assets
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join("app", "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+# URL the built assets are served from, with long-lived cache headers
+ASSETS_URL = "/assets"
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".ico", ".txt")
+RESIZABLE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Widths (pixels) of the downscaled image variants
+IMAGE_WIDTHS = (480, 960)
+# /static/<path> in CSS, with ?w=<width> to pick a downscaled variant (ignored when served unbuilt)
+CSS_ASSET_URL = re.compile(rb"/static/([\w./-]+)(?:\?w=(\d+))?")
+
+# Logical path (relative to app/static) -> {"url": ..., "width": ..., "variants": {width: url}}
+manifest = {}
+
+def _write(path: str, data: bytes, compress: bool):
+    """
+    Write a built asset, with its gzip variant next to it if asked.
+    """
+    with open(path, "wb") as file:
+        file.write(data)
+    if compress:
+        with open(path + ".gz", "wb") as file:
+            file.write(gzip.compress(data, compresslevel=9, mtime=0))
+
+def _downscale(source: str, stem: str, extension: str) -> tuple:
+    """
+    Write the downscaled variants of an image,
+    and return a tuple: (Image width, Dict width -> File name). Needs Pillow, skipped without it.
+    """
+    try:
+        from PIL import Image  # Only needed to build the image variants
+    except ImportError:
+        logger.warning("Pillow isn't installed, skipping the downscaled variants of %s.", source)
+        return None, {}
+
+    variants = {}
+    with Image.open(source) as image:
+        width, height = image.size
+        for variant_width in IMAGE_WIDTHS:
+            if variant_width >= width:
+                continue
+            variant = image.resize((variant_width, round(height * variant_width / width)), Image.LANCZOS)
+            file_name = f"{stem}.w{variant_width}{extension}"
+            save_options = {"quality": 80, "optimize": True, "progressive": True} if extension != ".png" else {"optimize": True}
+            variant.save(os.path.join(DIST_DIR, file_name), **save_options)
+            variants[variant_width] = file_name
+    return width, variants
+
+def _built_url(built: dict, match) -> str:
+    """
+    Return the built URL of a /static/<path> reference of a CSS file, or of its downscaled
+    variant for /static/<path>?w=<width>. References to unknown files are kept as they are.
+    """
+    entry = built.get(match.group(1).decode())
+    if entry is None:
+        return match.group(0).decode()
+    width = match.group(2)
+    if width is not None:
+        return entry.get("variants", {}).get(width.decode(), entry["url"])
+    return entry["url"]
+
+def build_assets() -> dict:
+    """
+    Build app/static into app/static/dist and write its manifest, and return the manifest.
+    CSS files are built last so their url(...) references point to the built images.
+    """
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+
+    sources = []
+    for directory, subdirectories, file_names in os.walk(STATIC_DIR):
+        subdirectories[:] = [name for name in subdirectories if os.path.join(directory, name) != DIST_DIR]
+        for file_name in file_names:
+            source = os.path.join(directory, file_name)
+            sources.append(os.path.relpath(source, STATIC_DIR).replace(os.sep, "/"))
+    sources.sort(key=lambda path: (path.endswith(".css"), path))
+
+    built = {}
+    for path in sources:
+        with open(os.path.join(STATIC_DIR, path), "rb") as file:
+            data = file.read()
+        base, extension = os.path.splitext(path)
+        extension = extension.lower()
+
+        if extension == ".css":
+            data = CSS_ASSET_URL.sub(lambda match: _built_url(built, match).encode(), data)
+
+        stem = f"{base.replace('/', '-')}.{hashlib.sha256(data).hexdigest()[:12]}"
+        _write(os.path.join(DIST_DIR, stem + extension), data, extension in COMPRESSIBLE_EXTENSIONS)
+        entry = {"url": f"{ASSETS_URL}/{stem}{extension}"}
+
+        if extension in RESIZABLE_EXTENSIONS:
+            width, variants = _downscale(os.path.join(STATIC_DIR, path), stem, extension)
+            if variants:
+                entry["width"] = width
+                entry["variants"] = {str(variant_width): f"{ASSETS_URL}/{file_name}" for variant_width, file_name in variants.items()}
+        built[path] = entry
+
+    with open(MANIFEST_PATH, "w") as file:
+        json.dump(built, file, indent=2)
+    return built
+
+def load_manifest() -> bool:
+    """
+    Load the manifest of the built assets,
+    and return a bool: True if found, False if the assets are served unbuilt from /static.
+    """
+    global manifest
+    try:
+        with open(MANIFEST_PATH) as file:
+            manifest = json.load(file)
+        return True
+    except FileNotFoundError:
+        logger.info("No built static assets, run 'python -m app.static_assets' to build them.")
+        manifest = {}
+        return False
+
+def asset_url(path: str) -> str:
+    """
+    Return the URL of a static asset, fingerprinted if the assets were built.
+    """
+    entry = manifest.get(path)
+    return entry["url"] if entry else f"/static/{path}"
+
+def asset_srcset(path: str) -> str:
+    """
+    Return the srcset of an image listing its downscaled variants, or an empty str if there are none.
+    """
+    entry = manifest.get(path)
+    if not entry or "variants" not in entry:
+        return ""
+    candidates = [f"{url} {width}w" for width, url in entry["variants"].items()]
+    candidates.append(f"{entry['url']} {entry['width']}w")
+    return ", ".join(candidates)
+
+class AssetFiles(StaticFiles):
+    """
+    Serves the built assets: cached for a year since their names change with their content,
+    and from the precompressed .gz file when the client accepts gzip.
+    """
+    async def check_config(self):
+        # Not built yet: answer 404 rather than failing every request
+        if os.path.isdir(self.directory):
+            await super().check_config()
+
+    async def get_response(self, path: str, scope):
+        response = None
+        if path.endswith(COMPRESSIBLE_EXTENSIONS) and "gzip" in Headers(scope=scope).get("accept-encoding", ""):
+            try:
+                response = await super().get_response(path + ".gz", scope)
+            except HTTPException:
+                pass  # No gzip variant, serve the file itself
+            else:
+                response.headers["Content-Encoding"] = "gzip"
+                response.headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    built = build_assets()
+    logger.info("Built %s static assets into %s.", len(built), DIST_DIR)
@@ -0,0 +1,142 @@
+# app/status_ingest.py
+
+import csv
+import logging
+import os
+import orjson
+from app import db_helper, metrics, order_status
+
+logger = logging.getLogger(__name__)
+
+# Updates applied per transaction
+STATUS_INGEST_BATCH_SIZE = int(os.getenv('STATUS_INGEST_BATCH_SIZE', 500))
+# Longer lines are rejected without being buffered
+MAX_LINE_BYTES = 4096
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+CSV_TYPES = ("text/csv",)
+
+class InvalidUpdate(ValueError):
+    """
+    Raised for a line that isn't a valid (order_id, status) update.
+    """
+
+async def iter_lines(chunks):
+    """
+    Split a stream of body chunks into lines as they arrive, without buffering the whole body.
+    Yields the bytes of each line, or None for a line longer than MAX_LINE_BYTES.
+    """
+    buffer = b""
+    skipping = False  # Inside an overlong line, dropping bytes until its end
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()  # Incomplete last line
+        for line in lines:
+            if skipping:
+                skipping = False
+            else:
+                yield line if len(line) <= MAX_LINE_BYTES else None
+        if len(buffer) > MAX_LINE_BYTES:
+            if not skipping:
+                yield None
+            skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield buffer
+
+def _validate(order_id, status) -> tuple:
+    """
+    Check the fields of an update, and return a tuple: (order_id, Normalized status).
+    """
+    if isinstance(order_id, str) and order_id.strip().isdigit():
+        order_id = int(order_id)
+    if not isinstance(order_id, int) or isinstance(order_id, bool) or order_id <= 0:
+        raise InvalidUpdate("order_id must be a positive integer")
+    if not isinstance(status, str) or status.strip().lower() not in order_status.ORDER_STATUSES:
+        raise InvalidUpdate(f"status must be one of: {', '.join(order_status.ORDER_STATUSES)}")
+    return order_id, status.strip().lower()
+
+def parse_ndjson_line(line: bytes) -> tuple:
+    """
+    Parse a {"order_id": ..., "status": ...} line, and return a tuple: (order_id, status).
+    """
+    try:
+        update = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise InvalidUpdate("not a JSON object")
+    if not isinstance(update, dict):
+        raise InvalidUpdate("not a JSON object")
+    return _validate(update.get("order_id"), update.get("status"))
+
+def parse_csv_line(line: bytes) -> tuple:
+    """
+    Parse an "order_id,status" line, and return a tuple: (order_id, status).
+    """
+    try:
+        fields = next(csv.reader([line.decode("utf-8")]))
+    except (UnicodeDecodeError, csv.Error, StopIteration):
+        raise InvalidUpdate("not a CSV row")
+    if len(fields) != 2:
+        raise InvalidUpdate("expected 2 columns: order_id,status")
+    return _validate(*fields)
+
+async def _apply(pending: list, results: list):
+    """
+    Apply a chunk of (line number, order_id, status) updates in one transaction and record their results.
+    """
+    found = await db_helper.update_order_statuses([(order_id, status) for _, order_id, status in pending])
+    for line_number, order_id, status in pending:
+        if found is None:
+            result = "failed"
+            order_status.invalidate(order_id)  # The transaction may have committed before failing, read it again
+        elif order_id in found:
+            result = "updated"
+            order_status.set_order_status(order_id, status)  # In line order, so the last update wins as in the database
+        else:
+            result = "not_found"
+        results.append({"line": line_number, "order_id": order_id, "result": result})
+
+async def ingest_order_statuses(chunks, content_type: str) -> dict:
+    """
+    Apply a stream of NDJSON or CSV status updates in chunks of STATUS_INGEST_BATCH_SIZE as it is read,
+    and return a dict: the count of each result and a per-line list of results.
+    The next chunk isn't read until the previous one is committed, so a fast sender is slowed down to the database's pace.
+    """
+    parse_line = parse_csv_line if content_type in CSV_TYPES else parse_ndjson_line
+    results = []
+    pending = []
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if line is None:
+            results.append({"line": line_number, "result": "invalid", "error": f"line longer than {MAX_LINE_BYTES} bytes"})
+            continue
+        line = line.strip()
+        if line_number == 1:
+            line = line.removeprefix(b"\xef\xbb\xbf")  # UTF-8 BOM
+            if parse_line is parse_csv_line and line.lower().startswith(b"order_id"):
+                continue  # CSV header
+        if not line:
+            continue
+        try:
+            order_id, status = parse_line(line)
+        except InvalidUpdate as e:
+            results.append({"line": line_number, "result": "invalid", "error": str(e)})
+            continue
+        pending.append((line_number, order_id, status))
+        if len(pending) >= STATUS_INGEST_BATCH_SIZE:
+            await _apply(pending, results)
+            pending = []
+    if pending:
+        await _apply(pending, results)
+
+    results.sort(key=lambda result: result["line"])
+    summary = {"updated": 0, "not_found": 0, "invalid": 0, "failed": 0}
+    for result in results:
+        summary[result["result"]] += 1
+    for result_name, count in summary.items():
+        if count:
+            metrics.status_updates.inc(result_name, count)
+    if summary["failed"]:
+        logger.warning("%s order status updates failed to apply.", summary["failed"])
+    return {**summary, "results": results}
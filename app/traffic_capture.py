@@ -0,0 +1,226 @@
+# app/traffic_capture.py
+
+import asyncio
+import hashlib
+import heapq
+import hmac
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from app import metrics, responses
+
+logger = logging.getLogger(__name__)
+
+# Capture is off unless a directory is set
+TRAFFIC_CAPTURE_DIR = os.getenv('TRAFFIC_CAPTURE_DIR', '')
+# Size of a capture file before a new one is started, and capture files kept
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv('TRAFFIC_CAPTURE_MAX_MB', 64)) * 2 ** 20
+TRAFFIC_CAPTURE_MAX_FILES = int(os.getenv('TRAFFIC_CAPTURE_MAX_FILES', 10))
+# Key of the session id hashes, required: all the workers must share it for a session's turns to match
+TRAFFIC_CAPTURE_SALT = os.getenv('TRAFFIC_CAPTURE_SALT', '')
+TRAFFIC_CAPTURE_FLUSH_INTERVAL = float(os.getenv('TRAFFIC_CAPTURE_FLUSH_MS', 200)) / 1000
+# Lines waiting for the writer before new ones are dropped
+TRAFFIC_CAPTURE_MAX_PENDING = 10_000
+
+# capture.<start time in ms>.<worker pid>.jsonl, so the names sort in time order and each worker has its own files
+FILE_NAME = re.compile(r"capture\.(\d+)\.(\d+)\.jsonl$")
+
+UNKNOWN_INTENT_BODY = responses.unknown_intent().body
+OVERLOADED_BODY = responses.overloaded().body
+ERROR_MARK = "❗".encode()
+
+# Lines not written yet, the writer thread and task, created by start()
+pending = []
+executor = None
+writer_task = None
+# Current file, only used by the writer thread
+capture_file = None
+capture_file_size = 0
+
+def outcome(status_code: int, body: bytes) -> str:
+    """
+    Classify a webhook reply, and return one of: ok, error, shed, unknown_intent.
+    """
+    if status_code >= 400 or ERROR_MARK in body:
+        return "error"
+    if body == OVERLOADED_BODY:
+        return "shed"
+    if body == UNKNOWN_INTENT_BODY:
+        return "unknown_intent"
+    return "ok"
+
+def anonymize(value: str):
+    """
+    Return a stable keyed hash of an identifier, or None for None.
+    """
+    if value is None:
+        return None
+    return hmac.new(TRAFFIC_CAPTURE_SALT.encode(), value.encode(), hashlib.sha256).hexdigest()[:24]
+
+def record(webhook_request, response, elapsed: float):
+    """
+    Buffer one captured webhook call, if capture is running. Only the fields the handlers use are kept,
+    with the session and response ids hashed; the user's text and the platform payload are never stored.
+    """
+    if writer_task is None:
+        return
+    if len(pending) >= TRAFFIC_CAPTURE_MAX_PENDING:
+        metrics.captured_requests.inc("dropped")
+        return
+    pending.append(orjson.dumps({
+        "t": round(time.time(), 3),
+        "session": anonymize(webhook_request.session_id),
+        "response_id": anonymize(webhook_request.response_id) if webhook_request.response_id else "",
+        "intent": webhook_request.intent_name,
+        "parameters": webhook_request.parameters,
+        "latency_ms": round(elapsed * 1000, 3),
+        "outcome": outcome(response.status_code, response.body),
+    }, option=orjson.OPT_APPEND_NEWLINE))
+    metrics.captured_requests.inc("captured")
+
+def request_body(captured: dict) -> bytes:
+    """
+    Return the webhook request body replaying a captured call.
+    """
+    body = {"responseId": captured["response_id"], "queryResult": {"intent": {"displayName": captured["intent"]}, "parameters": captured["parameters"]}}
+    if captured["session"]:
+        body["session"] = f"projects/replay/agent/sessions/{captured['session']}"
+    return orjson.dumps(body)
+
+def capture_files(directory: str) -> list:
+    """
+    Return the paths of the capture files of a directory, oldest first.
+    """
+    names = [name for name in os.listdir(directory) if FILE_NAME.match(name)]
+    names.sort(key=lambda name: tuple(map(int, FILE_NAME.match(name).groups())))
+    return [os.path.join(directory, name) for name in names]
+
+# Writer thread
+
+def _is_closed(pid: int) -> bool:
+    """
+    Check if the capture files of a worker are closed,
+    and return a bool: True if it is this worker or a process that has exited, False otherwise.
+    """
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        # os.kill can't probe a process on Windows, leave the other workers' files alone
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+def _rotate():
+    global capture_file, capture_file_size
+    if capture_file is not None:
+        capture_file.close()
+    capture_file = open(os.path.join(TRAFFIC_CAPTURE_DIR, f"capture.{time.time_ns() // 1_000_000}.{os.getpid()}.jsonl"), "ab")
+    capture_file_size = 0
+
+    # Keep the newest files, only removing this worker's older files and those of exited workers
+    for path in capture_files(TRAFFIC_CAPTURE_DIR)[:-TRAFFIC_CAPTURE_MAX_FILES]:
+        if path != capture_file.name and _is_closed(int(FILE_NAME.search(path).group(2))):
+            os.remove(path)
+
+def _write(data: bytes):
+    global capture_file_size
+    if capture_file is None or capture_file_size >= TRAFFIC_CAPTURE_MAX_BYTES:
+        _rotate()
+    capture_file.write(data)
+    capture_file.flush()
+    capture_file_size += len(data)
+
+def _close_file():
+    global capture_file
+    if capture_file is not None:
+        capture_file.close()
+        capture_file = None
+
+# Event loop
+
+async def flush():
+    """
+    Hand the buffered lines to the writer thread and wait until they are written.
+    """
+    if pending:
+        data = b"".join(pending)
+        pending.clear()
+        await asyncio.get_running_loop().run_in_executor(executor, _write, data)
+
+async def write_captures():
+    """
+    Write the buffered lines periodically.
+    """
+    while True:
+        await asyncio.sleep(TRAFFIC_CAPTURE_FLUSH_INTERVAL)
+        try:
+            await flush()
+        except OSError as e:
+            logger.error("Error writing the traffic capture: %s", e)
+
+def start():
+    """
+    Start capturing the webhook calls, if TRAFFIC_CAPTURE_DIR is set. Capture stays off without
+    TRAFFIC_CAPTURE_SALT, as the workers would hash the same session differently.
+    """
+    global executor, writer_task
+    if not TRAFFIC_CAPTURE_DIR:
+        return
+    if not TRAFFIC_CAPTURE_SALT:
+        logger.error("Traffic capture turned off, TRAFFIC_CAPTURE_SALT must be set with TRAFFIC_CAPTURE_DIR.")
+        return
+    os.makedirs(TRAFFIC_CAPTURE_DIR, exist_ok=True)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="traffic-capture")
+    writer_task = asyncio.create_task(write_captures())
+    logger.info("Capturing the webhook calls to %s.", TRAFFIC_CAPTURE_DIR)
+
+async def stop():
+    """
+    Stop capturing, writing the lines still buffered.
+    """
+    global executor, writer_task
+    if writer_task is None:
+        return
+    writer_task.cancel()
+    try:
+        await writer_task
+    except asyncio.CancelledError:
+        pass
+    writer_task = None
+    try:
+        await flush()
+    except OSError as e:
+        logger.error("Error writing the traffic capture: %s", e)
+    await asyncio.get_running_loop().run_in_executor(executor, _close_file)
+    executor.shutdown(wait=True)
+    executor = None
+
+def _read_capture_file(file_path: str):
+    """
+    Read the captured calls of one file lazily, and yield them as dicts. A truncated last line is skipped.
+    """
+    with open(file_path, "rb") as file:
+        for line in file:
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logger.warning("Skipping a truncated line in %s.", file_path)
+
+def read_captures(paths: list):
+    """
+    Read captured calls lazily from capture files, or from the capture files of directories,
+    and yield them as dicts in time order. The workers write overlapping files, so they are
+    merged on the capture time rather than read one after another.
+    """
+    file_paths = []
+    for path in paths:
+        file_paths.extend(capture_files(path) if os.path.isdir(path) else [path])
+    yield from heapq.merge(*map(_read_capture_file, file_paths), key=lambda captured: captured["t"])
@@ -0,0 +1,53 @@
+# app/webhook_payload.py
+
+from typing import NamedTuple
+import orjson
+from app import generic_helper
+
+class MalformedPayload(ValueError):
+    """
+    Raised when a webhook body isn't a Dialogflow WebhookRequest.
+    """
+
+class WebhookRequest(NamedTuple):
+    """
+    The parts of a Dialogflow WebhookRequest used by the intent handlers.
+    """
+    intent_name: str
+    parameters: dict
+    session_id: str
+    response_id: str
+
+def _expect(value, expected_type, field: str):
+    if not isinstance(value, expected_type):
+        raise MalformedPayload(f"{field} must be a {expected_type.__name__}")
+    return value
+
+def decode_webhook_request(body: bytes) -> WebhookRequest:
+    """
+    Decode and validate the raw body of a webhook call, and return a WebhookRequest.
+    Raises MalformedPayload if the body isn't a valid Dialogflow request.
+    """
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError as error:
+        raise MalformedPayload(f"Invalid JSON: {error}") from None
+
+    _expect(payload, dict, "payload")
+    query_result = _expect(payload.get('queryResult', {}), dict, "queryResult")
+    intent = _expect(query_result.get('intent', {}), dict, "queryResult.intent")
+    intent_name = _expect(intent.get('displayName', ''), str, "queryResult.intent.displayName")
+    parameters = _expect(query_result.get('parameters', {}), dict, "queryResult.parameters")
+    output_contexts = _expect(query_result.get('outputContexts', []), list, "queryResult.outputContexts")
+    response_id = _expect(payload.get('responseId', ''), str, "responseId")
+
+    # The session id is in every context name, and in the session field for requests without contexts
+    session_path = output_contexts[0].get('name', '') if output_contexts and isinstance(output_contexts[0], dict) else ''
+    session_id = generic_helper.extract_session_id(session_path) if session_path else None
+    if session_id is None and isinstance(payload.get('session'), str):
+        session_id = payload['session'].rpartition('/sessions/')[2] or None
+    if session_id is None:
+        # Carts are keyed by session, a turn without one can't be handled
+        raise MalformedPayload("No session id in outputContexts or session")
+
+    return WebhookRequest(intent_name, parameters, session_id, response_id)
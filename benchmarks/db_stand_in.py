@@ -0,0 +1,289 @@
+# benchmarks/db_stand_in.py
+
+import asyncio
+import json
+import random
+import re
+import sqlite3
+from decimal import Decimal
+import pymysql
+
+# SQLite version of setup/uma_food_chatbot.sql
+SCHEMA = """
+CREATE TABLE food_items (
+    item_id INTEGER PRIMARY KEY,
+    name TEXT COLLATE NOCASE,
+    price DECIMAL(10,2)
+);
+CREATE TABLE order_tracking (
+    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE orders (
+    order_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL REFERENCES food_items (item_id),
+    quantity INTEGER,
+    total_price DECIMAL(10,2),
+    PRIMARY KEY (order_id, item_id)
+);
+CREATE TABLE sales_by_item (
+    item_id INTEGER PRIMARY KEY,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+    order_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE sales_by_hour (
+    sales_hour TIMESTAMP PRIMARY KEY,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0
+);
+INSERT INTO food_items VALUES (1, 'Salmon Sushi', '6.00'), (2, 'Tuna Sushi', '7.00'), (3, 'Chirasi', '8.00');
+INSERT INTO order_tracking VALUES (40, 'delivered', '2024-06-01 12:10:00'), (41, 'in transit', '2024-06-01 12:45:00');
+INSERT INTO orders VALUES (40, 1, 2, '12.00'), (40, 3, 1, '8.00'), (41, 1, 3, '18.00'), (41, 2, 2, '14.00');
+INSERT INTO sales_by_item VALUES (1, 5, '30.00', 2), (2, 2, '14.00', 1), (3, 1, '8.00', 1);
+INSERT INTO sales_by_hour VALUES ('2024-06-01 12:00:00', 2, 8, '52.00');
+"""
+
+MENU = ["Salmon Sushi", "Tuna Sushi", "Chirasi"]
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()))
+
+def _translate_error(error: sqlite3.Error) -> pymysql.err.Error:
+    """
+    Map a sqlite3 error to the pymysql error aiomysql would raise for it.
+    """
+    if isinstance(error, sqlite3.IntegrityError):
+        return pymysql.err.IntegrityError(1062, str(error))
+    return pymysql.err.OperationalError(2013, str(error))
+
+def _translate_query(query: str) -> str:
+    """
+    Rewrite the MySQL specific syntax app.db_helper uses into SQLite.
+    """
+    query = re.sub(r"\s+AS new\s+ON DUPLICATE KEY UPDATE", " ON CONFLICT DO UPDATE SET", query)
+    query = re.sub(r"\bnew\.", "excluded.", query)
+    query = re.sub(r"\s+FOR UPDATE\b", "", query)
+    return query.replace("%s", "?")
+
+def _place_orders(db, carts: str, checkout_time) -> list:
+    """
+    SQLite version of the place_orders procedure of setup/uma_food_chatbot.sql, run in the open transaction.
+    """
+    results, placed_order_ids = [], []
+    placed_count = placed_items = 0
+    placed_revenue = Decimal(0)
+    for cart in json.loads(carts):
+        db.execute("SAVEPOINT cart_start")
+        db.execute("INSERT INTO order_tracking (status, created_at) VALUES ('in progress', ?)", (checkout_time,))
+        new_order_id = db.execute("SELECT last_insert_rowid()").fetchone()[0]
+        inserted = db.execute(
+            """
+            INSERT INTO orders (order_id, item_id, quantity, total_price)
+            SELECT ?, f.item_id, cart.value ->> '$.quantity', f.price * (cart.value ->> '$.quantity')
+            FROM json_each(?) AS cart JOIN food_items f ON f.name = cart.value ->> '$.name'
+            """,
+            (new_order_id, json.dumps(cart)),
+        ).rowcount
+        if inserted != len(cart):
+            db.execute("ROLLBACK TO cart_start")
+            db.execute("RELEASE cart_start")
+            results.append([0, "0"])
+            continue
+        db.execute("RELEASE cart_start")
+
+        item_count, total_order_price = db.execute(
+            "SELECT SUM(quantity), SUM(total_price) FROM orders WHERE order_id = ?", (new_order_id,)
+        ).fetchone()
+        total_order_price = Decimal(str(total_order_price)).quantize(Decimal("0.01"))
+        placed_order_ids.append(new_order_id)
+        results.append([new_order_id, str(total_order_price)])
+        placed_count += 1
+        placed_items += item_count
+        placed_revenue += total_order_price
+
+    if placed_count:
+        db.execute(
+            f"""
+            INSERT INTO sales_by_item (item_id, quantity, revenue, order_count)
+            SELECT item_id, SUM(quantity), SUM(total_price), COUNT(*) FROM orders
+            WHERE order_id IN ({", ".join("?" * len(placed_order_ids))}) GROUP BY item_id ORDER BY item_id
+            ON CONFLICT DO UPDATE SET quantity = sales_by_item.quantity + excluded.quantity,
+                revenue = sales_by_item.revenue + excluded.revenue, order_count = sales_by_item.order_count + excluded.order_count
+            """,
+            placed_order_ids,
+        )
+        db.execute(
+            """
+            INSERT INTO sales_by_hour (sales_hour, order_count, item_count, revenue) VALUES (?, ?, ?, ?)
+            ON CONFLICT DO UPDATE SET order_count = sales_by_hour.order_count + excluded.order_count,
+                item_count = sales_by_hour.item_count + excluded.item_count, revenue = sales_by_hour.revenue + excluded.revenue
+            """,
+            (checkout_time.replace(minute=0, second=0), placed_count, placed_items, placed_revenue),
+        )
+    return [(json.dumps(results),)]
+
+# Stored procedures called by app.db_helper, each run as one statement
+PROCEDURES = {"place_orders": _place_orders}
+
+class StandInCursor:
+    """
+    Subset of the aiomysql cursor API used by app.db_helper.
+    """
+    def __init__(self, connection):
+        self._connection = connection
+        self._rows = []
+        self.lastrowid = None
+        self.rowcount = -1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def _run(self, query, params_seq, many):
+        await self._connection.pool.simulate_latency()
+        call = re.match(r"\s*CALL\s+(\w+)", query, re.IGNORECASE)
+        if call:
+            await self._call(PROCEDURES[call.group(1)], params_seq)
+            return
+        is_write = not query.lstrip().upper().startswith("SELECT")
+        if is_write:
+            await self._connection.begin_write()
+        sql = _translate_query(query)
+        try:
+            db = self._connection.pool.db
+            sqlite_cursor = db.executemany(sql, params_seq) if many else db.execute(sql, params_seq or ())
+        except sqlite3.Error as error:
+            raise _translate_error(error)
+        self._rows = sqlite_cursor.fetchall()
+        self.rowcount = sqlite_cursor.rowcount
+        self.lastrowid = sqlite_cursor.lastrowid
+        if not many and self.rowcount > 1:
+            # MySQL reports the first id of a multi-row INSERT, SQLite the last one
+            self.lastrowid -= self.rowcount - 1
+
+    async def _call(self, procedure, params):
+        """
+        Run a procedure in its own transaction, committed before returning like the MySQL ones.
+        """
+        await self._connection.begin_write()
+        try:
+            rows = procedure(self._connection.pool.db, *params)
+        except sqlite3.Error as error:
+            self._connection._end_write("ROLLBACK")
+            raise _translate_error(error)
+        self._connection._end_write("COMMIT")
+        self._rows = rows
+        self.rowcount = len(rows)
+
+    async def execute(self, query, params=None):
+        await self._run(query, params, many=False)
+        return self.rowcount
+
+    async def executemany(self, query, params_seq):
+        await self._run(query, list(params_seq), many=True)
+        return self.rowcount
+
+    async def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    async def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+class StandInConnection:
+    """
+    Subset of the aiomysql connection API used by app.db_helper.
+    All connections share one SQLite database; write transactions are serialized,
+    reads are not, which is enough to reproduce read-then-write races.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = False
+        self.last_usage = asyncio.get_running_loop().time()
+        self._holds_write_lock = False
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    async def begin_write(self):
+        if not self._holds_write_lock:
+            await self.pool.write_lock.acquire()
+            self._holds_write_lock = True
+            self.pool.db.execute("BEGIN")
+
+    def _end_write(self, statement):
+        if self._holds_write_lock:
+            self.pool.db.execute(statement)
+            self._holds_write_lock = False
+            self.pool.write_lock.release()
+        self.last_usage = asyncio.get_running_loop().time()
+
+    async def begin(self):
+        await self.pool.simulate_latency()
+
+    async def commit(self):
+        await self.pool.simulate_latency()
+        self._end_write("COMMIT")
+
+    async def rollback(self):
+        self._end_write("ROLLBACK")
+
+    async def ping(self, reconnect=True):
+        await self.pool.simulate_latency()
+
+    def get_transaction_status(self):
+        return self._holds_write_lock
+
+    def close(self):
+        self._end_write("ROLLBACK")
+        self.closed = True
+
+class StandInPool:
+    """
+    In-process replacement for the aiomysql pool in app.db_helper, backed by SQLite.
+    latency is the (min, max) delay in seconds injected before every statement and commit.
+    """
+    def __init__(self, latency=(0.0, 0.0), maxsize=10):
+        self.db = sqlite3.connect(":memory:", isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.db.executescript(SCHEMA)
+        self.latency = latency
+        self.write_lock = asyncio.Lock()
+        self.statements = 0
+        self._slots = asyncio.Semaphore(maxsize)
+
+    async def simulate_latency(self):
+        self.statements += 1
+        low, high = self.latency
+        await asyncio.sleep(random.uniform(low, high) if high else 0)
+
+    async def acquire(self):
+        await self._slots.acquire()
+        return StandInConnection(self)
+
+    def release(self, connection):
+        if connection.get_transaction_status():
+            connection.close()
+        self._slots.release()
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        self.db.close()
+
+def install(latency=(0.0, 0.0), maxsize=10) -> StandInPool:
+    """
+    Create a stand-in pool and make app.db_helper use it instead of MySQL.
+    """
+    from app import db_helper
+    pool = StandInPool(latency, maxsize)
+    db_helper.db_pool = pool
+    return pool
@@ -0,0 +1,72 @@
+# benchmarks/load_shedding.py
+"""
+Send track_order calls faster than a slow SQLite stand-in can answer them, with a few
+prompt_confirm calls mixed in, and count the calls answered within Dialogflow's deadline.
+
+Usage: python -m benchmarks.load_shedding [--rate 200] [--seconds 5] [--latency-ms 100] [--no-admission]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import httpx
+import orjson
+from benchmarks import db_stand_in
+from app import admission, main, menu_catalog
+
+# Dialogflow gives up on the webhook after this many seconds
+DIALOGFLOW_DEADLINE = 5.0
+
+def payload(intent: str, parameters: dict, session: str) -> bytes:
+    return orjson.dumps({
+        "responseId": f"{session}-{random.random()}",
+        "session": f"projects/bench/agent/sessions/{session}",
+        "queryResult": {"intent": {"displayName": intent}, "parameters": parameters},
+    })
+
+async def timed_call(client, body: bytes) -> tuple:
+    start = time.perf_counter()
+    response = await client.post("/", content=body)
+    return time.perf_counter() - start, response.content
+
+async def run(rate: float, seconds: float, latency_ms: float, use_admission: bool) -> bool:
+    if not use_admission:
+        admission.ADMISSION_MAX_IN_FLIGHT = 10 ** 9
+    db_stand_in.install(latency=(latency_ms / 2000, latency_ms * 1.5 / 1000), maxsize=10)
+    await menu_catalog.load_menu()
+
+    calls = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        for n in range(int(rate * seconds)):
+            if n % 10 == 0:
+                body = payload("order.prompt_confirm - context: ongoing-order", {}, f"confirm-{n}")
+                kind = "prompt_confirm"
+            else:
+                body = payload("track.order - context: ongoing-tracking", {"order_id": 100_000 + n}, f"track-{n}")
+                kind = "track_order"
+            calls.append((kind, asyncio.create_task(timed_call(client, body))))
+            await asyncio.sleep(random.expovariate(rate))
+        results = [(kind, *await task) for kind, task in calls]
+
+    ok = True
+    for kind in ("track_order", "prompt_confirm"):
+        latencies = sorted(elapsed for call_kind, elapsed, _ in results if call_kind == kind)
+        shed = sum(1 for call_kind, _, body in results if call_kind == kind and b"very busy" in body)
+        in_time = sum(1 for call_kind, elapsed, body in results if call_kind == kind and elapsed <= DIALOGFLOW_DEADLINE and b"very busy" not in body)
+        late = sum(1 for elapsed in latencies if elapsed > DIALOGFLOW_DEADLINE)
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{kind}: {len(latencies)} calls, {in_time} answered in time, {shed} shed, {late} past the deadline, p99 {p99:.2f}s")
+        if use_admission and late:
+            ok = False
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=200, help="calls per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=100, help="mean database latency per statement")
+    parser.add_argument("--no-admission", action="store_true", help="run every call, as without admission control")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.rate, args.seconds, args.latency_ms, not args.no_admission)) else 1)
@@ -0,0 +1,46 @@
+# benchmarks/order_id_concurrency.py
+"""
+Fire many simultaneous complete_order calls against the SQLite stand-in and
+check that every checkout got its own order ID.
+
+Usage: python -m benchmarks.order_id_concurrency [--orders 500] [--latency-ms 5] [--no-batching]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from benchmarks import db_stand_in
+from app import main, menu_catalog, order_writer
+
+async def run(orders: int, latency_ms: float, batching: bool) -> bool:
+    pool = db_stand_in.install(latency=(0, latency_ms / 1000), maxsize=50)
+    await menu_catalog.load_menu()
+    if batching:
+        order_writer.start()
+
+    session_ids = [f"concurrency-{n}" for n in range(orders)]
+    for session_id in session_ids:
+        cart = {item: random.randint(1, 3) for item in random.sample(db_stand_in.MENU, 2)}
+        await main.session_store.update_cart(session_id, cart)
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(main.complete_order(session_id, {}) for session_id in session_ids))
+    elapsed = time.perf_counter() - start
+    await order_writer.stop()
+
+    placed = [r for r in responses if b"placed your order" in r.body]
+    rows = pool.db.execute("SELECT order_id FROM order_tracking WHERE status = 'in progress'").fetchall()
+    order_ids = [row[0] for row in rows]
+
+    print(f"{len(placed)}/{orders} checkouts placed in {elapsed:.3f}s, {len(set(order_ids))} distinct order IDs, {pool.statements} statements")
+    return len(placed) == orders and len(set(order_ids)) == orders
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--no-batching", action="store_true", help="save each order in its own transaction")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.orders, args.latency_ms, not args.no_batching)) else 1)
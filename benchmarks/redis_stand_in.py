@@ -0,0 +1,119 @@
+# benchmarks/redis_stand_in.py
+
+import fnmatch
+import time
+
+class StandInPipeline:
+    """
+    Subset of the redis.asyncio pipeline API used by app.sessions, run as one step like MULTI/EXEC.
+    """
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        command = getattr(self._client, f"_{name}")
+        return lambda *args, **kwargs: self._commands.append((command, args, kwargs))
+
+    async def execute(self):
+        commands, self._commands = self._commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+class StandInRedis:
+    """
+    In-process replacement for the redis.asyncio client of app.sessions.RedisSessionStore,
+    with string and hash keys expired like Redis does. Values are str, as with decode_responses=True.
+    """
+    def __init__(self):
+        self.data = {}
+        self.expires_at = {}
+
+    def _live(self, key: str) -> bool:
+        expires_at = self.expires_at.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            del self.expires_at[key]
+        return key in self.data
+
+    def _hgetall(self, key: str) -> dict:
+        return dict(self.data[key]) if self._live(key) else {}
+
+    def _hset(self, key: str, mapping: dict) -> int:
+        fields = self.data[key] if self._live(key) else self.data.setdefault(key, {})
+        added = len(set(mapping) - set(fields))
+        fields.update({field: str(value) for field, value in mapping.items()})
+        return added
+
+    def _hmget(self, key: str, fields: list) -> list:
+        values = self._hgetall(key)
+        return [values.get(field) for field in fields]
+
+    def _hdel(self, key: str, *fields) -> int:
+        if not self._live(key):
+            return 0
+        removed = sum(1 for field in fields if self.data[key].pop(field, None) is not None)
+        if not self.data[key]:
+            self._delete(key)
+        return removed
+
+    def _exists(self, key: str) -> int:
+        return int(self._live(key))
+
+    def _expire(self, key: str, seconds: int) -> bool:
+        if not self._live(key):
+            return False
+        self.expires_at[key] = time.time() + seconds
+        return True
+
+    def _delete(self, *keys) -> int:
+        removed = 0
+        for key in keys:
+            if self._live(key):
+                del self.data[key]
+                self.expires_at.pop(key, None)
+                removed += 1
+        return removed
+
+    def _set(self, key: str, value: str, nx: bool = False, ex: int = None):
+        if nx and self._live(key):
+            return None
+        self.data[key] = value
+        self.expires_at.pop(key, None)
+        if ex is not None:
+            self.expires_at[key] = time.time() + ex
+        return True
+
+    def _get(self, key: str):
+        return self.data[key] if self._live(key) else None
+
+    def pipeline(self, transaction: bool = True) -> StandInPipeline:
+        return StandInPipeline(self)
+
+    async def hgetall(self, key: str) -> dict:
+        return self._hgetall(key)
+
+    async def delete(self, *keys) -> int:
+        return self._delete(*keys)
+
+    async def set(self, key: str, value: str, nx: bool = False, ex: int = None):
+        return self._set(key, value, nx, ex)
+
+    async def get(self, key: str):
+        return self._get(key)
+
+    async def scan_iter(self, match: str = "*", count: int = None):
+        for key in list(self.data):
+            if self._live(key) and fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def dbsize(self) -> int:
+        return sum(1 for key in list(self.data) if self._live(key))
+
+    async def aclose(self):
+        pass
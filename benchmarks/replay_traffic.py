@@ -0,0 +1,138 @@
+# benchmarks/replay_traffic.py
+"""
+Replay webhook calls captured with TRAFFIC_CAPTURE_DIR at the app, at their original pace,
+N times faster or as fast as possible, and compare the latency and outcome of each intent with
+the capture. The turns of a session are sent in order, each after the reply to the previous one,
+so the interleaving of the sessions is kept. Captures are read lazily, so long ones can be replayed.
+Captured latencies are timed in webhook_handler, replayed ones by the client, HTTP included.
+
+By default the app runs in-process against the SQLite stand-in; --url replays at a running server.
+
+Usage: python -m benchmarks.replay_traffic traffic_capture/ [--speed 1 | --speed 10 | --speed max]
+       [--url http://localhost:8000] [--latency-ms 2] [--max-in-flight 1000] [--output replay.json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+import httpx
+from benchmarks import webhook_turns
+from app import main, order_writer, traffic_capture
+
+def parse_speed(value: str) -> float:
+    return 0.0 if value == "max" else float(value)
+
+async def replay(captures, client, speed: float, max_in_flight: int) -> list:
+    """
+    Fire the captured calls, and return a list of tuples: (Captured call, Replay latency in seconds, Replay outcome).
+    speed 0 sends each call as soon as its session's previous turn is answered.
+    """
+    results = []
+    slots = asyncio.Semaphore(max_in_flight)
+    last_turns = {}  # session -> task of its latest turn
+
+    async def send(captured: dict, previous):
+        try:
+            if previous is not None:
+                await asyncio.wait({previous})
+            start = time.perf_counter()
+            try:
+                response = await client.post("/", content=traffic_capture.request_body(captured))
+                outcome = traffic_capture.outcome(response.status_code, response.content)
+            except httpx.HTTPError:
+                outcome = "error"
+            results.append((captured, time.perf_counter() - start, outcome))
+        finally:
+            slots.release()
+
+    def forget(session, task):
+        if last_turns.get(session) is task:
+            del last_turns[session]
+
+    loop = asyncio.get_running_loop()
+    replay_start = loop.time()
+    first_timestamp = None
+    tasks = set()
+    for captured in captures:
+        if first_timestamp is None:
+            first_timestamp = captured["t"]
+        if speed:
+            delay = replay_start + (captured["t"] - first_timestamp) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await slots.acquire()  # Stops reading the capture while too many calls are outstanding
+        session = captured["session"]
+        task = asyncio.create_task(send(captured, last_turns.get(session)))
+        if session is not None:
+            last_turns[session] = task
+            task.add_done_callback(lambda task, session=session: forget(session, task))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    return results
+
+def summarize(results: list, elapsed: float) -> dict:
+    by_intent = defaultdict(list)
+    for captured, seconds, outcome in results:
+        by_intent[captured["intent"]].append((captured, seconds, outcome))
+
+    intents = {}
+    for intent, calls in by_intent.items():
+        captured_latencies = sorted(captured["latency_ms"] for captured, _, _ in calls)
+        replay_latencies = sorted(seconds * 1000 for _, seconds, _ in calls)
+        stats = {"count": len(calls)}
+        for name, latencies in (("captured", captured_latencies), ("replay", replay_latencies)):
+            for q in (0.50, 0.95, 0.99):
+                stats[f"{name}_p{int(q * 100)}_ms"] = round(webhook_turns.percentile(latencies, q), 3)
+        for outcome in ("error", "shed"):
+            captured_count = sum(1 for captured, _, _ in calls if captured["outcome"] == outcome)
+            replay_count = sum(1 for _, _, replay_outcome in calls if replay_outcome == outcome)
+            stats[f"captured_{outcome}"] = captured_count
+            stats[f"replay_{outcome}"] = replay_count
+        stats["changed_outcomes"] = sum(1 for captured, _, replay_outcome in calls if captured["outcome"] != replay_outcome)
+        intents[webhook_turns.intent_key(intent)] = stats
+    return {"calls": len(results), "elapsed_s": round(elapsed, 3), "intents": intents}
+
+async def run(args) -> dict:
+    captures = traffic_capture.read_captures(args.paths)
+    start = time.perf_counter()
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            results = await replay(captures, client, args.speed, args.max_in_flight)
+    else:
+        await webhook_turns.reset(args.latency_ms, 0)
+        order_writer.start()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://replay") as client:
+            results = await replay(captures, client, args.speed, args.max_in_flight)
+        await order_writer.stop()
+    report = summarize(results, time.perf_counter() - start)
+    report["settings"] = {"speed": args.speed or "max", "url": args.url, "latency_ms": None if args.url else args.latency_ms}
+
+    print(f"{report['calls']} calls replayed in {report['elapsed_s']:.2f}s")
+    for name, stats in report["intents"].items():
+        print(f"  {name:<20} {stats['count']:>7} calls  "
+              f"p50 {stats['captured_p50_ms']:8.2f} -> {stats['replay_p50_ms']:8.2f}ms  "
+              f"p95 {stats['captured_p95_ms']:8.2f} -> {stats['replay_p95_ms']:8.2f}ms  "
+              f"p99 {stats['captured_p99_ms']:8.2f} -> {stats['replay_p99_ms']:8.2f}ms  "
+              f"errors {stats['captured_error']} -> {stats['replay_error']}  "
+              f"shed {stats['captured_shed']} -> {stats['replay_shed']}  "
+              f"{stats['changed_outcomes']} changed outcomes")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="capture files, or capture directories")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="replay speed factor, or max")
+    parser.add_argument("--url", help="replay at a running server instead of in-process")
+    parser.add_argument("--latency-ms", type=float, default=2, help="mean stand-in database latency per statement")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="outstanding calls before reading pauses")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,52 @@
+# benchmarks/response_serialization.py
+"""
+Compare the per-turn cost of building and serializing a webhook reply:
+nested dicts encoded by FastAPI (before) versus app.responses (after).
+
+Usage: python -m benchmarks.response_serialization [--number 100000]
+"""
+
+import argparse
+import json
+import timeit
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app import responses
+
+FULFILLMENT_TEXT = "Awesome 🎉! We have placed your order id 42. Your order total is $16.00 which you can pay at the time of delivery 📦."
+
+def dict_reply() -> bytes:
+    """
+    Reply as complete_order built it before app.responses, including its unused templates.
+    """
+    success_response_template = {
+        "fulfillmentMessages": [
+            {"text": {"text": ["Awesome 🎉! We have placed your order id {order_id}. Your order total is ${total_price:.2f} which you can pay at the time of delivery 📦."]}},
+            {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Menu 📋"}, {"text": "New order 🛒"}, {"text": "Track status 🚚"}, {"text": "Opening hours 🕒"}]}]]}}
+        ]
+    }
+    error_response_template = {
+        "fulfillmentMessages": [
+            {"text": {"text": ["❗Error placing order. Please try again."]}},
+            {"payload": {"richContent": [[{"type": "chips", "options": [{"text": "Order 🛒"}, {"text": "Menu 📋"}]}]]}}
+        ]
+    }
+    success_response_template["fulfillmentMessages"][0]["text"]["text"][0] = success_response_template["fulfillmentMessages"][0]["text"]["text"][0].format(order_id=42, total_price=16)
+    return JSONResponse(jsonable_encoder(success_response_template)).body
+
+def builder_reply() -> bytes:
+    """
+    Reply as complete_order builds it with app.responses.
+    """
+    return responses.message(FULFILLMENT_TEXT, responses.ORDER_PLACED).body
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    assert json.loads(dict_reply()) == json.loads(builder_reply())
+
+    for name, func in (("dict + jsonable_encoder", dict_reply), ("app.responses", builder_reply)):
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        print(f"{name:<24} {seconds / args.number * 1e6:8.2f} µs per reply")
@@ -0,0 +1,74 @@
+# benchmarks/session_memory.py
+"""
+Measure the memory held by the memory session store for many live sessions, compared with
+the previous layout (a dict of cart dicts next to an OrderedDict of activity times).
+
+Usage: python -m benchmarks.session_memory [--sessions 100000 1000000]
+"""
+
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from app import sessions
+
+# Canonical names, as returned by the menu resolver and shared by every cart
+MENU = ["Salmon Sushi", "Tuna Sushi", "Chirasi", "Miso Soup", "Edamame", "Green Tea Ice Cream"]
+
+def sample_carts(count: int) -> list:
+    """
+    Return a list of tuples: (Session id, Cart of 1 to 4 items).
+    """
+    random.seed(count)
+    return [
+        (str(uuid.uuid4()), {item: random.randint(1, 5) for item in random.sample(MENU, random.randint(1, 4))})
+        for _ in range(count)
+    ]
+
+def measure(fill) -> tuple:
+    """
+    Run fill() under tracemalloc, and return a tuple: (Bytes it still holds, What it returned).
+    The returned value is kept alive until after the measurement.
+    """
+    gc.collect()
+    tracemalloc.start()
+    held = fill()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, held
+
+def fill_previous_layout(carts: list):
+    active_orders_sessions = {}
+    last_activity_times = OrderedDict()
+    for session_id, cart in carts:
+        active_orders_sessions[session_id] = dict(cart)
+        last_activity_times[session_id] = time.time()
+    return active_orders_sessions, last_activity_times
+
+def fill_memory_store(carts: list):
+    store = sessions.MemorySessionStore(max_sessions=len(carts))
+
+    async def fill():
+        for session_id, cart in carts:
+            await store.update_cart(session_id, cart)
+
+    asyncio.run(fill())
+    return store
+
+def run(counts: list):
+    for count in counts:
+        carts = sample_carts(count)  # Session id strings are allocated here, outside the measurements
+        for name, fill in (("previous layout", fill_previous_layout), ("MemorySessionStore", fill_memory_store)):
+            size, held = measure(lambda: fill(carts))
+            print(f"{count:>9} sessions, {name:<18}: {size / 2 ** 20:8.1f} MiB, {size / count:6.0f} bytes/session (session id excluded)")
+            del held
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100_000, 1_000_000])
+    run(parser.parse_args().sessions)
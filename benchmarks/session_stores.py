@@ -0,0 +1,97 @@
+# benchmarks/session_stores.py
+"""
+Run the same conversation against every session store backend (memory, SQLite, and Redis through
+an in-process stand-in client) and check that they behave alike: carts, removals, expiry (which
+peeking at a cart doesn't delay), the live session count, and for the shared stores the claims and replies deduplicating webhook retries.
+
+Usage: python -m benchmarks.session_stores [--redis-url redis://localhost:6379/15]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from app import sessions
+from benchmarks.redis_stand_in import StandInRedis
+
+TTL = 1
+
+async def check(store, other_keys=None) -> list:
+    """
+    Run the conversation on a store, and return the list of the checks that failed.
+    """
+    failures = []
+
+    def expect(name, actual, expected):
+        if actual != expected:
+            failures.append(f"{name}: got {actual!r}, expected {expected!r}")
+
+    expect("unknown session", await store.get_cart("a"), None)
+    expect("update", await store.update_cart("a", {"Chirasi": 2}), {"Chirasi": 2})
+    expect("update again", await store.update_cart("a", {"Tuna Sushi": 1, "Chirasi": 3}), {"Chirasi": 3, "Tuna Sushi": 1})
+    expect("get", await store.get_cart("a"), {"Chirasi": 3, "Tuna Sushi": 1})
+    expect("peek", await store.peek_cart("a"), {"Chirasi": 3, "Tuna Sushi": 1})
+    expect("remove", await store.remove_items("a", ["Chirasi", "Edamame"]), (["Chirasi"], {"Tuna Sushi": 1}))
+    expect("remove everything", await store.remove_items("a", ["Tuna Sushi"]), (["Tuna Sushi"], {}))
+    expect("empty cart kept", await store.get_cart("a"), {})
+    expect("remove from unknown session", await store.remove_items("b", ["Chirasi"]), None)
+
+    await store.update_cart("b", {"Salmon Sushi": 1})
+    if other_keys:
+        await other_keys()
+    expect("live sessions", (await store.stats()).get("live_sessions"), 2)
+    await store.delete("a")
+    expect("deleted", await store.get_cart("a"), None)
+
+    # Peeking doesn't keep a session alive
+    await asyncio.sleep(TTL * 0.6)
+    expect("peek before expiry", await store.peek_cart("b"), {"Salmon Sushi": 1})
+    await asyncio.sleep(TTL * 0.6)
+    expect("peek after expiry", await store.peek_cart("b"), None)
+    await store.cleanup()
+    expect("expired", await store.get_cart("b"), None)
+    expect("live sessions after expiry", (await store.stats()).get("live_sessions"), 0)
+
+    if store.shared:
+        expect("claim", await store.claim_reply("r1:a", 5), (True, None))
+        expect("claim while running", await store.claim_reply("r1:a", 5), (False, None))
+        await store.save_reply("r1:a", b'{"fulfillmentText": "done"}', 200, 5)
+        expect("claim answered", await store.claim_reply("r1:a", 5), (False, (b'{"fulfillmentText": "done"}', 200)))
+        expect("claim other call", await store.claim_reply("r2:a", 5), (True, None))
+        await store.release_reply("r2:a")
+        expect("claim released", await store.claim_reply("r2:a", 5), (True, None))
+    return failures
+
+async def run(redis_url: str) -> bool:
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        client = StandInRedis()
+        if redis_url:
+            import redis.asyncio as redis
+            client = redis.from_url(redis_url, decode_responses=True)
+            await client.flushdb()
+
+        async def add_other_keys():
+            # Keys of other applications sharing the Redis database aren't sessions
+            await client.set("other:key", "1")
+
+        stores = [
+            ("memory", sessions.MemorySessionStore(ttl=TTL), None),
+            ("sqlite", sessions.SQLiteSessionStore(os.path.join(directory, "sessions.db"), ttl=TTL), None),
+            ("redis", sessions.RedisSessionStore(redis_url, ttl=TTL, client=client), add_other_keys),
+        ]
+        for name, store, other_keys in stores:
+            await store.start()
+            failures = await check(store, other_keys)
+            await store.close()
+            print(f"{name}: {'ok' if not failures else 'FAILED'}")
+            for failure in failures:
+                print(f"  {failure}")
+            ok = ok and not failures
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--redis-url", help="check against this Redis server instead of the stand-in (its database is flushed)")
+    sys.exit(0 if asyncio.run(run(parser.parse_args().redis_url)) else 1)
@@ -0,0 +1,256 @@
+# benchmarks/webhook_turns.py
+"""
+Drive webhook_handler in-process with synthetic Dialogflow conversations covering every intent,
+against the SQLite stand-in, and report the throughput and p50/p95/p99 latency per intent and the
+memory held per open session as the number of concurrent sessions grows.
+
+The results can be written as JSON (--output) and compared with an earlier run (--compare), which
+fails if an intent's p95 got slower by more than --max-regression percent and --min-delta-ms.
+
+Usage: python -m benchmarks.webhook_turns [--sessions 100 500 2000] [--latency-ms 2] [--think-ms 20]
+       [--output results.json] [--compare baseline.json] [--max-regression 25] [--min-delta-ms 1]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+import orjson
+from starlette.requests import Request
+from benchmarks import db_stand_in
+from app import idempotency, main, menu_catalog, order_status, order_writer, sessions
+
+NEW_ORDER = "new.order"
+ADD = "order.add - context: ongoing-order"
+REMOVE = "order.remove - context: ongoing-order"
+CONFIRM = "order.prompt_confirm - context: ongoing-order"
+CANCEL = "order.cancel - context: ongoing-order"
+COMPLETE = "order.complete - context: ongoing-order"
+TRACK = "track.order - context: ongoing-tracking"
+INTENTS = [NEW_ORDER, ADD, REMOVE, CONFIRM, CANCEL, COMPLETE, TRACK]
+
+PLACED_ORDER_ID = re.compile(rb"order id (\d+)")
+
+def intent_key(intent: str) -> str:
+    return intent.split(" - ")[0]
+
+def payload(intent: str, parameters: dict, session_id: str) -> bytes:
+    return orjson.dumps({
+        "responseId": f"{session_id}-{random.getrandbits(64):x}",
+        "queryResult": {
+            "intent": {"displayName": intent},
+            "parameters": parameters,
+            "outputContexts": [{"name": f"projects/bench/agent/sessions/{session_id}/contexts/ongoing-order"}],
+        },
+    })
+
+def webhook_request(body: bytes) -> Request:
+    """
+    Return the Request webhook_handler gets for a POST of the body.
+    """
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"content-type", b"application/json")]}
+    return Request(scope, receive)
+
+async def turn(intent: str, parameters: dict, session_id: str) -> tuple:
+    """
+    Run one webhook turn, and return a tuple: (Seconds it took, Reply body, Outcome: ok, error or shed).
+    """
+    body = payload(intent, parameters, session_id)
+    start = time.perf_counter()
+    response = await main.webhook_handler(webhook_request(body))
+    elapsed = time.perf_counter() - start
+    if b"very busy" in response.body:
+        outcome = "shed"
+    elif response.status_code >= 400 or "❗".encode() in response.body:
+        outcome = "error"
+    else:
+        outcome = "ok"
+    return elapsed, response.body, outcome
+
+def conversation(n: int) -> list:
+    """
+    Return the turns before checkout of the n-th synthetic session, as (intent, parameters) pairs.
+    Every fourth session also cancels once before completing.
+    """
+    first, second, third = random.sample(db_stand_in.MENU, 3)
+    turns = [
+        (NEW_ORDER, {}),
+        (ADD, {"food-item": [first, second], "qty": [random.randint(1, 3), random.randint(1, 3)]}),
+        (ADD, {"food-item": [third], "qty": [1]}),
+        (REMOVE, {"food-item": [third]}),
+        (CONFIRM, {}),
+    ]
+    if n % 4 == 0:
+        turns += [(CANCEL, {}), (CONFIRM, {})]
+    return turns
+
+async def run_session(n: int, ramp: float, think: float, results: list):
+    session_id = f"bench-{n}"
+    await asyncio.sleep(random.uniform(0, ramp))
+    turns = conversation(n) + [(COMPLETE, {})]
+    for intent, parameters in turns:
+        elapsed, body, outcome = await turn(intent, parameters, session_id)
+        results.append((intent, elapsed, outcome))
+        if think:
+            await asyncio.sleep(random.expovariate(1 / think))
+
+    placed = PLACED_ORDER_ID.search(body)
+    if placed:
+        elapsed, _, outcome = await turn(TRACK, {"order_id": int(placed.group(1))}, session_id)
+        results.append((TRACK, elapsed, outcome))
+
+async def reset(latency_ms: float, sessions_count: int):
+    """
+    Start from a fresh stand-in database, session store and caches.
+    """
+    db_stand_in.install(latency=(latency_ms / 2000, latency_ms * 1.5 / 1000), maxsize=10)
+    # No cart journal: the benchmark measures the turns, not the files
+    main.session_store = sessions.MemorySessionStore(max_sessions=max(sessions_count, sessions.SESSION_MAX_SESSIONS))
+    idempotency.completed_replies.clear()
+    order_status.status_cache.clear()
+    await menu_catalog.load_menu()
+
+def percentile(latencies: list, q: float) -> float:
+    """
+    Return the nearest-rank percentile q (0..1) of sorted latencies.
+    """
+    return latencies[max(0, math.ceil(q * len(latencies)) - 1)]
+
+def summarize(results: list, elapsed: float) -> dict:
+    intents = {}
+    for intent in INTENTS:
+        outcomes = [outcome for call_intent, _, outcome in results if call_intent == intent]
+        # Shed turns are answered at once, they are counted but left out of the latencies
+        latencies = sorted(seconds for call_intent, seconds, outcome in results if call_intent == intent and outcome != "shed")
+        if not latencies:
+            continue
+        intents[intent_key(intent)] = {
+            "count": len(outcomes),
+            "errors": outcomes.count("error"),
+            "shed": outcomes.count("shed"),
+            "throughput_per_s": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        }
+    return {
+        "turns": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(results) / elapsed, 1),
+        "errors": sum(1 for _, _, outcome in results if outcome == "error"),
+        "shed": sum(1 for _, _, outcome in results if outcome == "shed"),
+        "intents": intents,
+    }
+
+async def measure_latency(sessions_count: int, latency_ms: float, ramp: float, think: float) -> dict:
+    await reset(latency_ms, sessions_count)
+    order_writer.start()
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(n, ramp, think, results) for n in range(sessions_count)))
+    elapsed = time.perf_counter() - start
+    await order_writer.stop()
+    return summarize(results, elapsed)
+
+async def measure_memory(sessions_count: int, latency_ms: float) -> dict:
+    """
+    Open sessions_count sessions with a cart each, under tracemalloc,
+    and return the memory they hold with the idempotency cache included.
+    """
+    await reset(latency_ms, sessions_count)
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for n in range(sessions_count):
+        for intent, parameters in conversation(n)[:2]:
+            await turn(intent, parameters, f"memory-{n}")
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"bytes_held": after - before, "bytes_per_session": round((after - before) / sessions_count)}
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+def compare(report: dict, baseline: dict, max_regression: float, min_delta_ms: float) -> bool:
+    """
+    Print the p95 and throughput changes since the baseline run, and return False if an intent's
+    p95 got slower by more than max_regression percent and min_delta_ms (sub-millisecond turns are noisy).
+    """
+    ok = True
+    baseline_runs = {run["sessions"]: run for run in baseline["runs"]}
+    print(f"Compared with {baseline.get('commit') or 'the baseline'}:")
+    for run in report["runs"]:
+        previous = baseline_runs.get(run["sessions"])
+        if previous is None:
+            continue
+        for name, stats in run["intents"].items():
+            before = previous["intents"].get(name)
+            if not before or not before["p95_ms"]:
+                continue
+            p95_change = (stats["p95_ms"] / before["p95_ms"] - 1) * 100
+            throughput_change = (stats["throughput_per_s"] / before["throughput_per_s"] - 1) * 100
+            flag = ""
+            if p95_change > max_regression and stats["p95_ms"] - before["p95_ms"] > min_delta_ms:
+                flag = "  REGRESSION"
+                ok = False
+            print(f"{run['sessions']:>7} sessions {name:<20} p95 {p95_change:+6.1f}%  throughput {throughput_change:+6.1f}%{flag}")
+    return ok
+
+async def run(args) -> dict:
+    report = {
+        "benchmark": "webhook_turns",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {"latency_ms": args.latency_ms, "think_ms": args.think_ms, "ramp_s": args.ramp},
+        "runs": [],
+    }
+    for sessions_count in args.sessions:
+        random.seed(sessions_count)
+        result = {"sessions": sessions_count}
+        result.update(await measure_latency(sessions_count, args.latency_ms, args.ramp, args.think_ms / 1000))
+        result["memory"] = await measure_memory(sessions_count, args.latency_ms)
+        report["runs"].append(result)
+
+        print(f"{sessions_count} sessions: {result['turns']} turns in {result['elapsed_s']:.2f}s, "
+              f"{result['throughput_per_s']:.0f} turns/s, {result['errors']} errors, {result['shed']} shed, "
+              f"{result['memory']['bytes_per_session']} bytes held per open session")
+        for name, stats in result["intents"].items():
+            print(f"  {name:<20} {stats['count']:>7} turns  p50 {stats['p50_ms']:8.2f}ms  "
+                  f"p95 {stats['p95_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100, 500, 2000], help="concurrent sessions per run")
+    parser.add_argument("--latency-ms", type=float, default=2, help="mean database latency per statement")
+    parser.add_argument("--think-ms", type=float, default=20, help="mean pause between the turns of a session")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which the sessions start")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=25, help="p95 slowdown in percent that fails --compare")
+    parser.add_argument("--min-delta-ms", type=float, default=1, help="smallest p95 slowdown in ms that fails --compare")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            sys.exit(0 if compare(report, json.load(file), args.max_regression, args.min_delta_ms) else 1)
@@ -1,8 +1,54 @@
+import argparse
+import importlib.util
+import os
 import uvicorn
+from dotenv import load_dotenv
+
+# Same settings as the workers, which load .env in the app
+load_dotenv()
 
 def run_uvicorn():
     """Run the Uvicorn server with specified configurations."""
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
 
+def run_production(host: str, port: int, workers: int):
+    """
+    Run the Uvicorn server for production: pre-forked workers without the reloader,
+    uvloop and the httptools parser when installed, and a graceful shutdown that lets
+    the webhook turns in flight finish. Each worker warms up in the app lifespan
+    (database pool, menu, templates) before it takes traffic.
+    """
+    uvicorn.run(
+        "app.main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        lifespan="on",
+        access_log=False,
+        timeout_graceful_shutdown=int(os.getenv('GRACEFUL_SHUTDOWN_TIMEOUT', 10)),
+    )
+
 if __name__ == "__main__":
-    run_uvicorn()
+    parser = argparse.ArgumentParser(description="Run the Uma chatbot webhook server.")
+    parser.add_argument("--prod", action="store_true", default=os.getenv('APP_MODE') == 'production',
+                        help="production mode (also enabled by APP_MODE=production)")
+    parser.add_argument("--host", default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.getenv('PORT', 8000)))
+    parser.add_argument("--workers", type=int, default=os.getenv('WEB_CONCURRENCY') or None,
+                        help="worker processes in production mode (default: WEB_CONCURRENCY, or the CPU count with "
+                             "a shared session store and 1 with the memory store)")
+    args = parser.parse_args()
+
+    # Each worker has its own memory store: a conversation served by two workers would lose its cart
+    memory_store = os.getenv('SESSION_STORE', 'memory') == 'memory'
+    if args.workers is None:
+        args.workers = 1 if memory_store else os.cpu_count() or 1
+    if args.prod and args.workers > 1 and memory_store:
+        parser.error(f"{args.workers} workers need a shared session store, set SESSION_STORE=sqlite or SESSION_STORE=redis")
+
+    if args.prod:
+        run_production(args.host, args.port, args.workers)
+    else:
+        run_uvicorn()
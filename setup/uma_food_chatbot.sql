@@ -17,17 +17,23 @@ INSERT INTO `food_items` VALUES
 (3,'Chirasi',8.00);
 
 -- Table structure for table `order_tracking`
+-- order_id is AUTO_INCREMENT: new order IDs are allocated by inserting the tracking row.
+-- created_at is the checkout time, used by the hourly sales rollup.
+-- Existing databases can be migrated with:
+--   ALTER TABLE `order_tracking` MODIFY `order_id` int NOT NULL AUTO_INCREMENT;
+--   ALTER TABLE `order_tracking` ADD `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP;
 DROP TABLE IF EXISTS `order_tracking`;
 CREATE TABLE `order_tracking` (
-  `order_id` int NOT NULL,
+  `order_id` int NOT NULL AUTO_INCREMENT,
   `status` varchar(255) DEFAULT NULL,
+  `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`order_id`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+) ENGINE=InnoDB AUTO_INCREMENT=42 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- Dumping data for table `order_tracking`
 INSERT INTO `order_tracking` VALUES 
-(40,'delivered'),
-(41,'in transit');
+(40,'delivered','2024-06-01 12:10:00'),
+(41,'in transit','2024-06-01 12:45:00');
 
 -- Table structure for table `orders`
 DROP TABLE IF EXISTS `orders`;
@@ -47,3 +53,115 @@ INSERT INTO `orders` VALUES
 (40,3,1,8.00),
 (41,1,3,18.00),
 (41,2,2,14.00);
+
+-- Sales rollups, updated in the transaction saving each order and read by the /reports endpoints.
+-- After creating them on an existing database, fill them with:
+--   python -m app.sales_reports --rebuild
+
+-- Table structure for table `sales_by_item`
+DROP TABLE IF EXISTS `sales_by_item`;
+CREATE TABLE `sales_by_item` (
+  `item_id` int NOT NULL,
+  `quantity` int NOT NULL DEFAULT 0,
+  `revenue` decimal(12,2) NOT NULL DEFAULT 0,
+  `order_count` int NOT NULL DEFAULT 0,
+  PRIMARY KEY (`item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- Dumping data for table `sales_by_item`
+INSERT INTO `sales_by_item` VALUES 
+(1,5,30.00,2),
+(2,2,14.00,1),
+(3,1,8.00,1);
+
+-- Table structure for table `sales_by_hour`
+DROP TABLE IF EXISTS `sales_by_hour`;
+CREATE TABLE `sales_by_hour` (
+  `sales_hour` datetime NOT NULL,
+  `order_count` int NOT NULL DEFAULT 0,
+  `item_count` int NOT NULL DEFAULT 0,
+  `revenue` decimal(12,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`sales_hour`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- Dumping data for table `sales_by_hour`
+INSERT INTO `sales_by_hour` VALUES 
+('2024-06-01 12:00:00',2,8,52.00);
+
+-- Checkout in one round trip: saves a batch of orders and their sales rollups in one transaction,
+-- pricing the items from `food_items`, and returns a JSON array with the [order_id, "total_price"]
+-- of each cart, in order. A cart with an item that isn't on the menu gets [0, "0"] and isn't saved;
+-- the other carts are. Called by app.db_helper.save_orders_to_db with a JSON array of carts, each
+-- an array of {"name": ..., "quantity": ...}, and the checkout time.
+-- Existing databases get it by running this block.
+DROP PROCEDURE IF EXISTS `place_order`;
+DROP PROCEDURE IF EXISTS `place_orders`;
+DELIMITER $$
+CREATE PROCEDURE `place_orders`(IN `carts` json, IN `checkout_time` datetime)
+BEGIN
+  DECLARE `cart_index` int DEFAULT 0;
+  DECLARE `cart` json;
+  DECLARE `new_order_id` int;
+  DECLARE `order_item_count` int;
+  DECLARE `total_order_price` decimal(12,2);
+  DECLARE `placed_order_ids` json DEFAULT JSON_ARRAY();
+  DECLARE `results` json DEFAULT JSON_ARRAY();
+  DECLARE `placed_count` int DEFAULT 0;
+  DECLARE `placed_item_count` int DEFAULT 0;
+  DECLARE `placed_revenue` decimal(12,2) DEFAULT 0;
+  DECLARE EXIT HANDLER FOR SQLEXCEPTION
+  BEGIN
+    ROLLBACK;
+    RESIGNAL;
+  END;
+
+  START TRANSACTION;
+  WHILE `cart_index` < JSON_LENGTH(`carts`) DO
+    SET `cart` = JSON_EXTRACT(`carts`, CONCAT('$[', `cart_index`, ']'));
+    SAVEPOINT `cart_start`;
+    INSERT INTO `order_tracking` (`status`, `created_at`) VALUES ('in progress', `checkout_time`);
+    SET `new_order_id` = LAST_INSERT_ID();
+
+    INSERT INTO `orders` (`order_id`, `item_id`, `quantity`, `total_price`)
+    SELECT `new_order_id`, f.`item_id`, c.`quantity`, f.`price` * c.`quantity`
+    FROM JSON_TABLE(`cart`, '$[*]' COLUMNS (
+      `name` varchar(255) PATH '$.name',
+      `quantity` int PATH '$.quantity'
+    )) AS c
+    JOIN `food_items` f ON f.`name` = c.`name` COLLATE utf8mb4_0900_ai_ci;
+
+    IF ROW_COUNT() <> JSON_LENGTH(`cart`) THEN
+      ROLLBACK TO SAVEPOINT `cart_start`;
+      SET `results` = JSON_ARRAY_APPEND(`results`, '$', JSON_ARRAY(0, '0'));
+    ELSE
+      SELECT SUM(`quantity`), SUM(`total_price`) INTO `order_item_count`, `total_order_price`
+      FROM `orders` WHERE `order_id` = `new_order_id`;
+      SET `placed_order_ids` = JSON_ARRAY_APPEND(`placed_order_ids`, '$', `new_order_id`);
+      SET `results` = JSON_ARRAY_APPEND(`results`, '$', JSON_ARRAY(`new_order_id`, CAST(`total_order_price` AS char)));
+      SET `placed_count` = `placed_count` + 1;
+      SET `placed_item_count` = `placed_item_count` + `order_item_count`;
+      SET `placed_revenue` = `placed_revenue` + `total_order_price`;
+    END IF;
+    SET `cart_index` = `cart_index` + 1;
+  END WHILE;
+
+  IF `placed_count` > 0 THEN
+    -- Rows are updated in item_id order so concurrent checkouts lock them in the same order
+    INSERT INTO `sales_by_item` (`item_id`, `quantity`, `revenue`, `order_count`)
+    SELECT o.`item_id`, o.`quantity`, o.`total_price`, 1
+    FROM JSON_TABLE(`placed_order_ids`, '$[*]' COLUMNS (`order_id` int PATH '$')) AS placed
+    JOIN `orders` o ON o.`order_id` = placed.`order_id`
+    ORDER BY o.`item_id`
+    ON DUPLICATE KEY UPDATE `quantity` = `sales_by_item`.`quantity` + o.`quantity`,
+      `revenue` = `sales_by_item`.`revenue` + o.`total_price`, `order_count` = `sales_by_item`.`order_count` + 1;
+
+    INSERT INTO `sales_by_hour` (`sales_hour`, `order_count`, `item_count`, `revenue`)
+    VALUES (DATE_FORMAT(`checkout_time`, '%Y-%m-%d %H:00:00'), `placed_count`, `placed_item_count`, `placed_revenue`) AS new
+    ON DUPLICATE KEY UPDATE `order_count` = `sales_by_hour`.`order_count` + new.`order_count`,
+      `item_count` = `sales_by_hour`.`item_count` + new.`item_count`, `revenue` = `sales_by_hour`.`revenue` + new.`revenue`;
+  END IF;
+
+  COMMIT;
+  SELECT `results`;
+END$$
+DELIMITER ;